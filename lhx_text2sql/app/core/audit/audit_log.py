@@ -1,14 +1,42 @@
-import json
-from datetime import datetime
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from uuid import uuid4
 
+from app.core.jsonutil import dumps_bytes
+
+_logger = logging.getLogger(__name__)
+
 
 class AuditLogger:
-    def __init__(self, path: str) -> None:
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 64,
+        batch_ms: int = 200,
+        fsync_every: int = 16,
+    ) -> None:
         self.path = Path(path)
         self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = max(1, int(batch_size))
+        self.batch_interval = max(0, int(batch_ms)) / 1000.0
+        self.fsync_every = max(1, int(fsync_every))
+        self._fh_lock = threading.Lock()
+        self._fh = self.path.open("ab")
+        self._unsynced_batches = 0
+        # Records lost to failed batch writes; each failure is also logged.
+        self.dropped_records = 0
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
 
     @staticmethod
     def new_id() -> str:
@@ -29,7 +57,8 @@ class AuditLogger:
     ) -> None:
         record = {
             "audit_log_id": audit_id,
-            "timestamp": datetime.utcnow().isoformat(),
+            # Formatted to ISO-8601 by the writer thread, off the query path.
+            "timestamp": time.time_ns(),
             "question": question,
             "user_context": user_context,
             "evidence_summary": evidence_summary,
@@ -40,5 +69,99 @@ class AuditLogger:
             "elapsed_ms": elapsed_ms,
             "error": error,
         }
-        with self.path.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if self._closed:
+            self._write_batch([record])
+            return
+        self._queue.put(record)
+
+    def flush(self) -> None:
+        if not self._closed:
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        # Short-lived instances must not leave a handler (and themselves) pinned until exit.
+        atexit.unregister(self.close)
+        self._queue.put(None)
+        self._worker.join()
+        with self._fh_lock:
+            self._sync()
+            self._fh.close()
+
+    def reopen(self) -> None:
+        # Call after external log rotation so new records go to a fresh file at self.path.
+        with self._fh_lock:
+            if self._fh.closed:
+                return
+            self._sync()
+            self._fh.close()
+            self._fh = self.path.open("ab")
+
+    @staticmethod
+    def _format_timestamp(timestamp_ns: int) -> str:
+        seconds, remainder = divmod(timestamp_ns, 1_000_000_000)
+        moment = datetime.fromtimestamp(seconds, tz=timezone.utc)
+        return moment.replace(tzinfo=None, microsecond=remainder // 1000).isoformat()
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is None:
+                self._queue.task_done()
+                return
+            batch = [record]
+            stop = self._fill_batch(batch)
+            try:
+                self._write_batch(batch)
+            except Exception:
+                # Keep the writer alive so a failed batch does not block later records.
+                self.dropped_records += len(batch)
+                _logger.exception("Dropped %d audit record(s) writing to %s", len(batch), self.path)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _fill_batch(self, batch: List[Dict[str, Any]]) -> bool:
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    item = self._queue.get(timeout=timeout)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                return False
+            if item is None:
+                return True
+            batch.append(item)
+        return False
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        lines = []
+        for record in batch:
+            record["timestamp"] = self._format_timestamp(record["timestamp"])
+            # Values JSON has no type for (Decimal, UUID, ...) are logged as str().
+            lines.append(dumps_bytes(record, default=str) + b"\n")
+        data = b"".join(lines)
+        with self._fh_lock:
+            if self._fh.closed:
+                with self.path.open("ab") as f:
+                    f.write(data)
+                return
+            self._fh.write(data)
+            self._fh.flush()
+            self._unsynced_batches += 1
+            if self._unsynced_batches >= self.fsync_every:
+                self._sync()
+
+    def _sync(self) -> None:
+        if self._unsynced_batches:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._unsynced_batches = 0
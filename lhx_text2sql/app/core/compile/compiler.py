@@ -1,8 +1,13 @@
-from typing import List, Optional, Tuple
+import itertools
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
 
-from sqlglot import exp, parse_one
+from sqlglot import exp
+from sqlglot.dialects.dialect import Dialect
 
-from app.core.models import EvidenceBundle, MetricDef, PlanDSL
+from app.core.models import EvidenceBundle, JoinPath, MetricDef, PlanDSL
 
 
 JOIN_TYPE_MAP = {
@@ -11,13 +16,121 @@ JOIN_TYPE_MAP = {
     "right": "RIGHT",
 }
 
+DEFAULT_LIMIT = 200
+TEMPLATE_CACHE_SIZE = 512
+ALLOWED_FIELDS_CACHE_SIZE = 64
+# Literal values are compiled as named placeholders and bound at render time,
+# so plans that only differ in filter/time values share one SQL template.
+_PARAM_PREFIX = "t2s_p"
+_PARAM_RE = re.compile(r":t2s_p(\d+)")
+_LIST_VALUE_OPS = {"in", "between"}
+_TIME_FIELD_NAMES = frozenset({"ts", "timestamp", "event_time", "date", "dt"})
+_TIME_DATA_TYPES = frozenset({"datetime", "timestamp", "date"})
+
+# Bound literals are formatted directly with the MySQL dialect's own quoting and
+# escape rules, so a cached template is rendered without touching sqlglot.
+_MYSQL = Dialect.get_or_raise("mysql")
+_STRING_ESCAPES = str.maketrans(
+    {
+        **_MYSQL.ESCAPED_SEQUENCES,
+        _MYSQL.QUOTE_END: _MYSQL.tokenizer_class.STRING_ESCAPES[0] + _MYSQL.QUOTE_END,
+    }
+)
+
+
+def _render_literal(value: Any) -> str:
+    if isinstance(value, (int, float)):
+        return str(value)
+    return f"{_MYSQL.QUOTE_START}{str(value).translate(_STRING_ESCAPES)}{_MYSQL.QUOTE_END}"
+
+
+def _mysql_func(name: str, *args: exp.Expression) -> exp.Expression:
+    return exp.func(name, *args, dialect="mysql")
+
+
+def _bucket_15m(col: exp.Expression) -> exp.Expression:
+    unix_ts = _mysql_func("UNIX_TIMESTAMP", col)
+    floored = _mysql_func("FLOOR", exp.Div(this=unix_ts, expression=exp.Literal.number(900)))
+    return _mysql_func("FROM_UNIXTIME", exp.Mul(this=floored, expression=exp.Literal.number(900)))
+
+
+def _in_expr(col: exp.Expression, value) -> exp.Expression:
+    if not isinstance(value, list):
+        raise ValueError("IN operator requires list value")
+    return exp.In(this=col, expressions=value)
+
+
+def _between_expr(col: exp.Expression, value) -> exp.Expression:
+    if not isinstance(value, list) or len(value) != 2:
+        raise ValueError("BETWEEN operator requires two values")
+    return exp.Between(this=col, low=value[0], high=value[1])
+
+
+_OP_BUILDERS = {
+    "=": lambda col, value: exp.EQ(this=col, expression=value),
+    "!=": lambda col, value: exp.NEQ(this=col, expression=value),
+    ">": lambda col, value: exp.GT(this=col, expression=value),
+    ">=": lambda col, value: exp.GTE(this=col, expression=value),
+    "<": lambda col, value: exp.LT(this=col, expression=value),
+    "<=": lambda col, value: exp.LTE(this=col, expression=value),
+    "like": lambda col, value: exp.Like(this=col, expression=value),
+    "in": _in_expr,
+    "between": _between_expr,
+}
+
+# Time buckets are built as ASTs directly so compile() never re-parses SQL text.
+_GRAIN_BUILDERS = {
+    "15m": _bucket_15m,
+    "hour": lambda col: _mysql_func("DATE_FORMAT", col, exp.Literal.string("%Y-%m-%d %H:00:00")),
+    "day": lambda col: _mysql_func("DATE_FORMAT", col, exp.Literal.string("%Y-%m-%d")),
+    "week": lambda col: _mysql_func("YEARWEEK", col, exp.Literal.number(1)),
+    "month": lambda col: _mysql_func("DATE_FORMAT", col, exp.Literal.string("%Y-%m")),
+}
+
 
 class SqlCompiler:
+    def __init__(self) -> None:
+        self._template_cache: "OrderedDict[tuple, List[str]]" = OrderedDict()
+        # Entries keep a reference to their bundle so its id() cannot be reused while cached.
+        self._allowed_cache: "OrderedDict[tuple, Tuple[EvidenceBundle, frozenset]]" = OrderedDict()
+        # The engine shares one compiler across request threads; guards both LRU caches.
+        self._cache_lock = threading.Lock()
+
     def compile(self, plan: PlanDSL, evidence: EvidenceBundle) -> str:
-        allowed_fields = self._build_allowed_fields(plan, evidence)
         metric_def = self._get_metric_def(plan.metric_id, evidence)
+        join_path = self._get_join_path(plan.join_path_id, evidence)
+        allowed_fields = self._allowed_fields(plan, evidence, metric_def, join_path)
         time_table, time_field = self._pick_time_field(evidence, metric_def)
-        base_table = self._pick_base_table(plan, evidence, metric_def, time_table)
+        base_table = self._pick_base_table(plan, metric_def, join_path, time_table)
+        self._check_fields(plan, allowed_fields)
+
+        key = self._shape_key(plan, metric_def, time_table, time_field, base_table, join_path)
+        with self._cache_lock:
+            template = self._template_cache.get(key)
+            if template is not None:
+                self._template_cache.move_to_end(key)
+        if template is None:
+            sql = self._build_sql(plan, metric_def, time_table, time_field, base_table, join_path)
+            template = _PARAM_RE.split(sql)
+            with self._cache_lock:
+                self._template_cache[key] = template
+                if len(self._template_cache) > TEMPLATE_CACHE_SIZE:
+                    self._template_cache.popitem(last=False)
+        return self._render(template, self._param_values(plan))
+
+    def _build_sql(
+        self,
+        plan: PlanDSL,
+        metric_def: MetricDef,
+        time_table: str,
+        time_field: str,
+        base_table: str,
+        join_path: Optional[JoinPath],
+    ) -> str:
+        counter = itertools.count()
+
+        def param() -> exp.Expression:
+            return exp.Placeholder(this=f"{_PARAM_PREFIX}{next(counter)}")
 
         select_exprs: List[exp.Expression] = []
         group_exprs: List[exp.Expression] = []
@@ -29,19 +142,15 @@ class SqlCompiler:
             group_exprs.append(exp.column("time_bucket"))
 
         for dim in plan.dimensions:
-            key = f"{dim.table}.{dim.field}"
-            if key not in allowed_fields:
-                raise ValueError(f"Dimension field not allowed: {key}")
-            col_expr = exp.column(dim.field, table=dim.table)
-            select_exprs.append(col_expr)
-            group_exprs.append(col_expr)
+            select_exprs.append(exp.column(dim.field, table=dim.table))
+            group_exprs.append(exp.column(dim.field, table=dim.table))
 
         metric_expr = self._metric_expr(metric_def)
         select_exprs.append(exp.alias_(metric_expr, plan.metric_id))
 
-        query = exp.select(*select_exprs).from_(base_table)
+        # Every node below is freshly built, so skip sqlglot's defensive deep copies.
+        query = exp.Select(expressions=select_exprs).from_(base_table, copy=False)
 
-        join_path = self._get_join_path(plan.join_path_id, evidence)
         if join_path:
             for edge in join_path.edges:
                 join_type = JOIN_TYPE_MAP.get(edge.join_type.lower(), "INNER")
@@ -49,61 +158,147 @@ class SqlCompiler:
                     this=exp.column(edge.left_field, table=edge.left_table),
                     expression=exp.column(edge.right_field, table=edge.right_table),
                 )
-                query = query.join(edge.right_table, on=on_expr, join_type=join_type)
+                query = query.join(
+                    edge.right_table, on=on_expr, join_type=join_type, copy=False
+                )
 
-        where_expr = self._time_range_filter(time_table, time_field, plan)
+        where_expr = self._time_range_filter(time_table, time_field, param(), param())
         for fil in plan.filters:
-            key = f"{fil.table}.{fil.field}"
-            if key not in allowed_fields:
-                raise ValueError(f"Filter field not allowed: {key}")
-            where_expr = self._and(where_expr, self._filter_expr(fil))
+            if fil.op in _LIST_VALUE_OPS and isinstance(fil.value, list):
+                value = [param() for _ in fil.value]
+            else:
+                value = param()
+            where_expr = self._and(where_expr, self._filter_expr(fil, value))
         if where_expr is not None:
-            query = query.where(where_expr)
+            query = query.where(where_expr, copy=False)
 
         if group_exprs:
-            query = query.group_by(*group_exprs)
+            query = query.group_by(*group_exprs, copy=False)
 
         if plan.sort:
-            order_expr = self._order_expr(plan, allowed_fields)
+            order_expr = self._order_expr(plan)
             if order_expr is not None:
-                query = query.order_by(order_expr)
+                query = query.order_by(order_expr, copy=False)
         elif plan.intent == "trend":
             # Ensure stable time ordering for trend queries.
-            query = query.order_by(exp.Ordered(this=exp.column("time_bucket"), desc=False))
+            query = query.order_by(
+                exp.Ordered(this=exp.column("time_bucket"), desc=False), copy=False
+            )
 
-        limit = plan.limit or 200
-        query = query.limit(limit)
+        limit = plan.limit or DEFAULT_LIMIT
+        query = query.limit(limit, copy=False)
 
         return query.sql(dialect="mysql")
 
     @staticmethod
-    def _build_allowed_fields(plan: PlanDSL, evidence: EvidenceBundle) -> set:
+    def _check_fields(plan: PlanDSL, allowed_fields: frozenset) -> None:
+        for dim in plan.dimensions:
+            key = f"{dim.table}.{dim.field}"
+            if key not in allowed_fields:
+                raise ValueError(f"Dimension field not allowed: {key}")
+        for fil in plan.filters:
+            key = f"{fil.table}.{fil.field}"
+            if key not in allowed_fields:
+                raise ValueError(f"Filter field not allowed: {key}")
+        if plan.sort:
+            SqlCompiler._check_sort(plan, allowed_fields)
+
+    @staticmethod
+    def _shape_key(
+        plan: PlanDSL,
+        metric_def: MetricDef,
+        time_table: str,
+        time_field: str,
+        base_table: str,
+        join_path: Optional[JoinPath],
+    ) -> tuple:
+        return (
+            plan.intent,
+            plan.metric_id,
+            tuple(metric_def.required_fields),
+            plan.time_grain,
+            time_table,
+            time_field,
+            base_table,
+            tuple((d.table, d.field) for d in plan.dimensions),
+            tuple(
+                (f.table, f.field, f.op, len(f.value) if isinstance(f.value, list) else None)
+                for f in plan.filters
+            ),
+            (plan.sort.by, plan.sort.order) if plan.sort else None,
+            plan.limit,
+            tuple(
+                (e.left_table, e.left_field, e.right_table, e.right_field, e.join_type)
+                for e in join_path.edges
+            )
+            if join_path
+            else None,
+        )
+
+    @staticmethod
+    def _param_values(plan: PlanDSL) -> List[Any]:
+        values: List[Any] = [plan.time_range.start, plan.time_range.end]
+        for fil in plan.filters:
+            if fil.op in _LIST_VALUE_OPS and isinstance(fil.value, list):
+                values.extend(fil.value)
+            else:
+                values.append(fil.value)
+        return values
+
+    @staticmethod
+    def _render(template: List[str], values: List[Any]) -> str:
+        parts = list(template)
+        for idx in range(1, len(parts), 2):
+            parts[idx] = _render_literal(values[int(parts[idx])])
+        return "".join(parts)
+
+    def _allowed_fields(
+        self,
+        plan: PlanDSL,
+        evidence: EvidenceBundle,
+        metric_def: MetricDef,
+        join_path: Optional[JoinPath],
+    ) -> frozenset:
+        key = (id(evidence), plan.metric_id, plan.join_path_id)
+        with self._cache_lock:
+            entry = self._allowed_cache.get(key)
+            if entry is not None and entry[0] is evidence:
+                self._allowed_cache.move_to_end(key)
+                return entry[1]
+        allowed = self._build_allowed_fields(evidence, metric_def, join_path)
+        with self._cache_lock:
+            self._allowed_cache[key] = (evidence, allowed)
+            if len(self._allowed_cache) > ALLOWED_FIELDS_CACHE_SIZE:
+                self._allowed_cache.popitem(last=False)
+        return allowed
+
+    @staticmethod
+    def _build_allowed_fields(
+        evidence: EvidenceBundle,
+        metric_def: MetricDef,
+        join_path: Optional[JoinPath],
+    ) -> frozenset:
         allowed = {f"{s.table}.{s.field}" for s in evidence.schema_candidates}
-        metric_def = next((m for m in evidence.metric_candidates if m.metric_id == plan.metric_id), None)
-        if metric_def:
-            for field in metric_def.required_fields:
-                if "." in field:
-                    allowed.add(field)
-        join_path = next((j for j in evidence.join_paths if j.join_path_id == plan.join_path_id), None)
+        for field in metric_def.required_fields:
+            if "." in field:
+                allowed.add(field)
         if join_path:
             for edge in join_path.edges:
                 allowed.add(f"{edge.left_table}.{edge.left_field}")
                 allowed.add(f"{edge.right_table}.{edge.right_field}")
-        return allowed
+        return frozenset(allowed)
 
     @staticmethod
     def _get_metric_def(metric_id: str, evidence: EvidenceBundle) -> MetricDef:
-        for metric in evidence.metric_candidates:
-            if metric.metric_id == metric_id:
-                return metric
-        raise ValueError("metric_id not found in evidence")
+        metric = evidence.get_metric(metric_id)
+        if metric is None:
+            raise ValueError("metric_id not found in evidence")
+        return metric
 
     @staticmethod
     def _pick_time_field(evidence: EvidenceBundle, metric_def: MetricDef) -> Tuple[str, str]:
         for item in evidence.schema_candidates:
-            if item.field.lower() in {"ts", "timestamp", "event_time", "date", "dt"}:
-                return item.table, item.field
-            if item.data_type.lower() in {"datetime", "timestamp", "date"}:
+            if item.field_lc in _TIME_FIELD_NAMES or item.data_type_lc in _TIME_DATA_TYPES:
                 return item.table, item.field
         for field in metric_def.required_fields:
             if field.endswith(".ts") or field.endswith(".date"):
@@ -114,11 +309,10 @@ class SqlCompiler:
     @staticmethod
     def _pick_base_table(
         plan: PlanDSL,
-        evidence: EvidenceBundle,
         metric_def: MetricDef,
+        join_path: Optional[JoinPath],
         time_table: str,
     ) -> str:
-        join_path = next((j for j in evidence.join_paths if j.join_path_id == plan.join_path_id), None)
         if join_path and join_path.edges:
             return join_path.edges[0].left_table
         if plan.dimensions:
@@ -130,20 +324,10 @@ class SqlCompiler:
 
     @staticmethod
     def _time_bucket_expr(table: str, field: str, grain: str) -> exp.Expression:
-        col_ref = f"{table}.{field}"
-        if grain == "15m":
-            expr = f"FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP({col_ref})/900)*900)"
-        elif grain == "hour":
-            expr = f"DATE_FORMAT({col_ref}, '%Y-%m-%d %H:00:00')"
-        elif grain == "day":
-            expr = f"DATE_FORMAT({col_ref}, '%Y-%m-%d')"
-        elif grain == "week":
-            expr = f"YEARWEEK({col_ref}, 1)"
-        elif grain == "month":
-            expr = f"DATE_FORMAT({col_ref}, '%Y-%m')"
-        else:
+        builder = _GRAIN_BUILDERS.get(grain)
+        if builder is None:
             raise ValueError("Unsupported time_grain")
-        return parse_one(expr, dialect="mysql")
+        return builder(exp.column(field, table=table))
 
     @staticmethod
     def _metric_expr(metric_def: MetricDef) -> exp.Expression:
@@ -160,52 +344,18 @@ class SqlCompiler:
         return exp.Div(this=sum_a, expression=exp.NullIf(this=sum_b, expression=exp.Literal.number(0)))
 
     @staticmethod
-    def _time_range_filter(table: str, field: str, plan: PlanDSL) -> exp.Expression:
+    def _time_range_filter(
+        table: str, field: str, start: exp.Expression, end: exp.Expression
+    ) -> exp.Expression:
         col_expr = exp.column(field, table=table)
-        return exp.Between(
-            this=col_expr,
-            low=exp.Literal.string(plan.time_range.start),
-            high=exp.Literal.string(plan.time_range.end),
-        )
-
-    @staticmethod
-    def _filter_expr(fil) -> exp.Expression:
-        col_expr = exp.column(fil.field, table=fil.table)
-        op = fil.op
-        value = fil.value
-        if op == "=":
-            return exp.EQ(this=col_expr, expression=SqlCompiler._literal(value))
-        if op == "!=":
-            return exp.NEQ(this=col_expr, expression=SqlCompiler._literal(value))
-        if op == ">":
-            return exp.GT(this=col_expr, expression=SqlCompiler._literal(value))
-        if op == ">=":
-            return exp.GTE(this=col_expr, expression=SqlCompiler._literal(value))
-        if op == "<":
-            return exp.LT(this=col_expr, expression=SqlCompiler._literal(value))
-        if op == "<=":
-            return exp.LTE(this=col_expr, expression=SqlCompiler._literal(value))
-        if op == "like":
-            return exp.Like(this=col_expr, expression=SqlCompiler._literal(value))
-        if op == "in":
-            if not isinstance(value, list):
-                raise ValueError("IN operator requires list value")
-            return exp.In(this=col_expr, expressions=[SqlCompiler._literal(v) for v in value])
-        if op == "between":
-            if not isinstance(value, list) or len(value) != 2:
-                raise ValueError("BETWEEN operator requires two values")
-            return exp.Between(
-                this=col_expr,
-                low=SqlCompiler._literal(value[0]),
-                high=SqlCompiler._literal(value[1]),
-            )
-        raise ValueError("Unsupported filter op")
+        return exp.Between(this=col_expr, low=start, high=end)
 
     @staticmethod
-    def _literal(value) -> exp.Expression:
-        if isinstance(value, (int, float)):
-            return exp.Literal.number(value)
-        return exp.Literal.string(str(value))
+    def _filter_expr(fil, value) -> exp.Expression:
+        builder = _OP_BUILDERS.get(fil.op)
+        if builder is None:
+            raise ValueError("Unsupported filter op")
+        return builder(exp.column(fil.field, table=fil.table), value)
 
     @staticmethod
     def _and(left: Optional[exp.Expression], right: exp.Expression) -> exp.Expression:
@@ -214,30 +364,34 @@ class SqlCompiler:
         return exp.and_(left, right)
 
     @staticmethod
-    def _order_expr(plan: PlanDSL, allowed_fields: set) -> Optional[exp.Expression]:
+    def _check_sort(plan: PlanDSL, allowed_fields: frozenset) -> None:
+        by = plan.sort.by
+        if by in {"metric", plan.metric_id} or by in {"time", "time_bucket"}:
+            return
+        if "." in by:
+            if by not in allowed_fields:
+                raise ValueError(f"Sort field not allowed: {by}")
+            return
+        if not any(field.endswith(f".{by}") for field in allowed_fields):
+            raise ValueError(f"Sort field not allowed: {by}")
+
+    @staticmethod
+    def _order_expr(plan: PlanDSL) -> Optional[exp.Expression]:
         by = plan.sort.by
+        desc = plan.sort.order == "desc"
         if by in {"metric", plan.metric_id}:
-            return exp.Ordered(this=exp.column(plan.metric_id), desc=plan.sort.order == "desc")
+            return exp.Ordered(this=exp.column(plan.metric_id), desc=desc)
         if by in {"time", "time_bucket"}:
             if plan.intent != "trend":
                 return None
-            return exp.Ordered(this=exp.column("time_bucket"), desc=plan.sort.order == "desc")
+            return exp.Ordered(this=exp.column("time_bucket"), desc=desc)
         if "." in by:
-            if by not in allowed_fields:
-                raise ValueError(f"Sort field not allowed: {by}")
             table, field = by.split(".", 1)
-            return exp.Ordered(
-                this=exp.column(field, table=table), desc=plan.sort.order == "desc"
-            )
-        if any(field.endswith(f".{by}") for field in allowed_fields):
-            return exp.Ordered(this=exp.column(by), desc=plan.sort.order == "desc")
-        raise ValueError(f"Sort field not allowed: {by}")
+            return exp.Ordered(this=exp.column(field, table=table), desc=desc)
+        return exp.Ordered(this=exp.column(by), desc=desc)
 
     @staticmethod
-    def _get_join_path(join_path_id: str, evidence: EvidenceBundle):
+    def _get_join_path(join_path_id: str, evidence: EvidenceBundle) -> Optional[JoinPath]:
         if join_path_id == "NONE":
             return None
-        for jp in evidence.join_paths:
-            if jp.join_path_id == join_path_id:
-                return jp
-        return None
+        return evidence.get_join_path(join_path_id)
@@ -12,6 +12,8 @@ class Settings(BaseSettings):
     metric_kb_path: str = "data/metric_kb.json"
     template_kb_path: str = "data/template_kb.json"
     audit_log_path: str = "data/audit_logs.jsonl"
+    audit_batch_size: int = 64
+    audit_batch_ms: int = 200
 
     llm_mode: str = "mock"
     llm_base_url: str = "https://api.siliconflow.cn/v1"
@@ -19,11 +21,21 @@ class Settings(BaseSettings):
     llm_model: str = ""
     llm_timeout: int = 30
     llm_max_retries: int = 2
+    llm_max_parse_retries: int = 2
+    llm_retry_base_delay_s: float = 0.5
+    llm_retry_max_delay_s: float = 30.0
     llm_force_json: bool = True
     llm_extract_json: bool = True
+    llm_gzip_requests: bool = False
     llm_plan_trim_top_k: int = 2
     llm_plan_retry_on_timeout: bool = True
+    llm_cache_enabled: bool = True
+    llm_cache_size: int = 1024
+    llm_cache_ttl_s: int = 1800
+    llm_semantic_cache_enabled: bool = False
+    llm_semantic_cache_threshold: float = 0.93
     use_mock_db: bool = True
+    preview_limit: int = 20
     fixed_metric_id: str = ""
 
     mysql_host: str = "localhost"
@@ -34,9 +46,13 @@ class Settings(BaseSettings):
     mysql_charset: str = "utf8mb4"
     mysql_connect_timeout: int = 5
     mysql_read_timeout: int = 30
+    mysql_pool_min_cached: int = 2
+    mysql_pool_max_cached: int = 10
 
     rag_top_k: int = 5
     rag_top_k_second: int = 8
+    rag_cache_size: int = 1024
+    rag_prefetch_second_pass: bool = False
 
     class Config:
         env_prefix = "TEXT2SQL_"
@@ -47,4 +63,4 @@ class Settings(BaseSettings):
 
 @lru_cache()
 def get_settings() -> Settings:
-    return Settings()
+    return Settings()
@@ -1,4 +1,5 @@
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, Optional
 
 from app.core.audit.audit_log import AuditLogger
@@ -6,8 +7,10 @@ from app.core.compile.compiler import SqlCompiler
 from app.core.config import get_settings
 from app.core.execute.answer import AnswerGenerator
 from app.core.execute.executor import QueryExecutor
+from app.core.jsonutil import dumps_bytes
 from app.core.llm.client import RealLLMClient
 from app.core.llm.mock_client import MockLLMClient
+from app.core.llm.semantic_cache import SemanticCacheLLMClient
 from app.core.planning.planner import Planner
 from app.core.planning.repair import PlanRepair
 from app.core.planning.validator import PlanValidator
@@ -34,9 +37,14 @@ class Text2SQLEngine:
         self.repairer = PlanRepair(
             self.llm_client, schema, prompt_path=f"{self.settings.prompt_dir}/plan_repair.txt"
         )
+        plan_llm_client = self.llm_client
+        if self.settings.llm_semantic_cache_enabled:
+            plan_llm_client = SemanticCacheLLMClient(
+                self.llm_client, threshold=self.settings.llm_semantic_cache_threshold
+            )
         self.planner = Planner(
             settings=self.settings,
-            llm_client=self.llm_client,
+            llm_client=plan_llm_client,
             schema_kb=self.schema_kb,
             join_kb=self.join_kb,
             metric_kb=self.metric_kb,
@@ -51,7 +59,11 @@ class Text2SQLEngine:
         self.answer_generator = AnswerGenerator(
             self.llm_client, prompt_path=f"{self.settings.prompt_dir}/answer_generate.txt"
         )
-        self.audit_logger = AuditLogger(self.settings.audit_log_path)
+        self.audit_logger = AuditLogger(
+            self.settings.audit_log_path,
+            batch_size=self.settings.audit_batch_size,
+            batch_ms=self.settings.audit_batch_ms,
+        )
 
     def _init_llm_client(self):
         if self.settings.llm_mode == "mock":
@@ -95,27 +107,29 @@ class Text2SQLEngine:
                 quality_warnings=exec_result.quality_warnings,
             )
             elapsed_ms = int((time.time() - start_time) * 1000)
+            plan_final = plan_result.plan.dict()
+            validation_errors = [e.dict() for e in plan_result.validation_errors]
             self.audit_logger.write(
                 audit_id=audit_id,
                 question=question,
                 user_context=user_context,
                 evidence_summary=plan_result.evidence_summary,
                 plan_initial=plan_result.plan_initial,
-                plan_final=plan_result.plan.dict(),
-                validation_errors=[e.dict() for e in plan_result.validation_errors],
+                plan_final=plan_final,
+                validation_errors=validation_errors,
                 sql=sql,
                 elapsed_ms=elapsed_ms,
                 error=None,
             )
             return {
                 "audit_log_id": audit_id,
-                "plan_dsl": plan_result.plan.dict(),
+                "plan_dsl": plan_final,
                 "sql": sql,
                 "data_preview": exec_result.data_preview.dict(),
                 "answer_text": answer_text,
                 "debug": {
                     "evidence_summary": plan_result.evidence_summary,
-                    "validation_errors": [e.dict() for e in plan_result.validation_errors],
+                    "validation_errors": validation_errors,
                 },
             }
         except Exception as exc:
@@ -135,41 +149,43 @@ class Text2SQLEngine:
             )
             raise ValueError(error_text) from exc
 
+    def run_query_json(
+        self,
+        question: str,
+        user_context: Optional[Dict[str, Any]] = None,
+        time_range: Optional[Dict[str, str]] = None,
+    ) -> bytes:
+        # Pre-encoded response body, so an HTTP layer can return it as-is instead of re-serializing.
+        return dumps_bytes(self.run_query(question, user_context, time_range), default=str)
+
     def test_connections(self) -> Dict[str, str]:
-        results: Dict[str, str] = {}
+        # The two pings are independent network round-trips, so run them side by side.
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            llm_future = pool.submit(self._check_llm)
+            mysql_future = pool.submit(self._check_mysql)
+            return {"llm": llm_future.result(), "mysql": mysql_future.result()}
+
+    def _check_llm(self) -> str:
         if self.settings.llm_mode == "mock":
-            results["llm"] = "mock"
-        else:
-            try:
-                client = RealLLMClient()
-                _ = client.generate_text("ping")
-                results["llm"] = "ok"
-            except Exception as exc:
-                results["llm"] = f"error: {exc}"
+            return "mock"
+        try:
+            client = RealLLMClient()
+            _ = client.generate_text("ping")
+            return "ok"
+        except Exception as exc:
+            return f"error: {exc}"
 
+    def _check_mysql(self) -> str:
         if self.settings.use_mock_db:
-            results["mysql"] = "mock"
-        else:
+            return "mock"
+        try:
+            conn = self.executor.connect()
             try:
-                import pymysql
-
-                conn = pymysql.connect(
-                    host=self.settings.mysql_host,
-                    port=self.settings.mysql_port,
-                    user=self.settings.mysql_user,
-                    password=self.settings.mysql_password,
-                    database=self.settings.mysql_database,
-                    charset=self.settings.mysql_charset,
-                    connect_timeout=self.settings.mysql_connect_timeout,
-                    read_timeout=self.settings.mysql_read_timeout,
-                )
-                try:
-                    with conn.cursor() as cursor:
-                        cursor.execute("SELECT 1")
-                        cursor.fetchone()
-                finally:
-                    conn.close()
-                results["mysql"] = "ok"
-            except Exception as exc:
-                results["mysql"] = f"error: {exc}"
-        return results
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+            finally:
+                conn.close()
+            return "ok"
+        except Exception as exc:
+            return f"error: {exc}"
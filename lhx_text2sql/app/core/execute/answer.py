@@ -1,8 +1,10 @@
-import json
 from typing import List
 
+from app.core.execute.quality import numeric_values
+from app.core.jsonutil import dumps
 from app.core.models import DataPreview, MetricDef, PlanDSL
 from app.core.llm.client import LLMClient
+from app.core.prompt import load_prompt
 
 
 class AnswerGenerator:
@@ -10,8 +12,7 @@ class AnswerGenerator:
         self.llm_client = llm_client
         self.prompt_template = ""
         try:
-            with open(prompt_path, "r", encoding="utf-8") as f:
-                self.prompt_template = f.read()
+            self.prompt_template = load_prompt(prompt_path)
         except FileNotFoundError:
             self.prompt_template = ""
 
@@ -32,7 +33,7 @@ class AnswerGenerator:
                 "metric_definition": metric_def.dict(),
                 "result_preview": data_preview.dict(),
             }
-            prompt = f"{self.prompt_template}\n\n{json.dumps(payload, ensure_ascii=False, default=str)}"
+            prompt = f"{self.prompt_template}\n\n{dumps(payload, default=str)}"
             try:
                 return self.llm_client.generate_text(prompt)
             except NotImplementedError:
@@ -67,13 +68,14 @@ class AnswerGenerator:
 
     @staticmethod
     def _extract_metric_value(metric_id: str, data_preview: DataPreview):
-        if metric_id not in data_preview.columns:
+        total = 0.0
+        count = 0
+        for value in numeric_values(data_preview, metric_id):
+            total += value
+            count += 1
+        if not count:
             return None
-        idx = data_preview.columns.index(metric_id)
-        values = [row[idx] for row in data_preview.rows if isinstance(row[idx], (int, float))]
-        if not values:
-            return None
-        return round(sum(values) / len(values), 4)
+        return round(total / count, 4)
 
     def _can_use_llm(self) -> bool:
         return self.llm_client.__class__.__name__ not in {"MockLLMClient"}
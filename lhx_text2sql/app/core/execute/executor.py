@@ -1,9 +1,13 @@
+import threading
 import time
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
 
 import pymysql
+from dbutils.pooled_db import PooledDB
+from sqlglot import parse_one
 
+from app.core.compile.compiler import DEFAULT_LIMIT
 from app.core.config import Settings
 from app.core.execute.quality import run_quality_checks
 from app.core.models import DataPreview, EvidenceBundle, MetricDef, PlanDSL
@@ -18,6 +22,30 @@ class ExecutionResult:
 class QueryExecutor:
     def __init__(self, settings: Settings) -> None:
         self.settings = settings
+        self._pool: Optional[PooledDB] = None
+        self._pool_lock = threading.Lock()
+
+    def connect(self):
+        return self._get_pool().connection()
+
+    def _get_pool(self) -> PooledDB:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = PooledDB(
+                        creator=pymysql,
+                        mincached=self.settings.mysql_pool_min_cached,
+                        maxcached=self.settings.mysql_pool_max_cached,
+                        host=self.settings.mysql_host,
+                        port=self.settings.mysql_port,
+                        user=self.settings.mysql_user,
+                        password=self.settings.mysql_password,
+                        database=self.settings.mysql_database,
+                        charset=self.settings.mysql_charset,
+                        connect_timeout=self.settings.mysql_connect_timeout,
+                        read_timeout=self.settings.mysql_read_timeout,
+                    )
+        return self._pool
 
     def execute(self, sql: str, plan: PlanDSL, evidence: EvidenceBundle) -> ExecutionResult:
         issues = self.estimate_cost(plan)
@@ -32,28 +60,32 @@ class QueryExecutor:
             return ExecutionResult(data_preview=data_preview, quality_warnings=warnings)
 
         start_time = time.time()
-        conn = pymysql.connect(
-            host=self.settings.mysql_host,
-            port=self.settings.mysql_port,
-            user=self.settings.mysql_user,
-            password=self.settings.mysql_password,
-            database=self.settings.mysql_database,
-            charset=self.settings.mysql_charset,
-            connect_timeout=self.settings.mysql_connect_timeout,
-            read_timeout=self.settings.mysql_read_timeout,
-        )
+        conn = self.connect()
         try:
             with conn.cursor() as cursor:
-                cursor.execute(sql)
-                rows = cursor.fetchmany(20)
+                cursor.execute(self._preview_sql(sql, plan))
+                rows = cursor.fetchall()
                 columns = [desc[0] for desc in cursor.description] if cursor.description else []
         finally:
             conn.close()
 
-        data_preview = DataPreview(columns=columns, rows=[list(row) for row in rows])
+        # Columns and rows come straight from the driver; skip pydantic's per-cell re-validation.
+        data_preview = DataPreview.construct(columns=columns, rows=[list(row) for row in rows])
         warnings = run_quality_checks(metric_def, data_preview)
         return ExecutionResult(data_preview=data_preview, quality_warnings=warnings)
 
+    def _preview_sql(self, sql: str, plan: PlanDSL) -> str:
+        # Only the preview rows are returned, so cap the server-side result set as well.
+        preview_limit = self.settings.preview_limit
+        limit = plan.limit or DEFAULT_LIMIT
+        if limit <= preview_limit:
+            return sql
+        # SqlCompiler always emits LIMIT as the final clause; swap it in place rather than re-parsing.
+        suffix = f" LIMIT {limit}"
+        if sql.endswith(suffix):
+            return f"{sql[:-len(suffix)]} LIMIT {preview_limit}"
+        return parse_one(sql, dialect="mysql").limit(preview_limit).sql(dialect="mysql")
+
     @staticmethod
     def estimate_cost(plan: PlanDSL) -> List[str]:
         issues: List[str] = []
@@ -65,9 +97,9 @@ class QueryExecutor:
 
     @staticmethod
     def _find_metric_def(metric_id: str, evidence: EvidenceBundle) -> MetricDef:
-        for metric in evidence.metric_candidates:
-            if metric.metric_id == metric_id:
-                return metric
+        metric = evidence.get_metric(metric_id)
+        if metric is not None:
+            return metric
         return MetricDef(
             metric_id=metric_id,
             name=metric_id,
@@ -102,4 +134,4 @@ class QueryExecutor:
         else:
             rows = [["sample"] * len(plan.dimensions) + [0.08]]
 
-        return DataPreview(columns=columns, rows=rows)
+        return DataPreview.construct(columns=columns, rows=rows)
@@ -0,0 +1,24 @@
+import json
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder.
+    orjson = None
+
+
+def dumps_bytes(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, default=default).encode("utf-8")
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers can catch the stdlib type.
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> str:
+    return dumps_bytes(obj, default=default).decode("utf-8")
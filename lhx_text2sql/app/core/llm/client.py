@@ -1,13 +1,55 @@
+import asyncio
+import base64
+import copy
+import gzip
+import hashlib
+import http.client
 import json
+import random
+import re
+import ssl
+import threading
+import time
+import zlib
 from abc import ABC, abstractmethod
-from typing import Dict
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
 from urllib import request
-from urllib.error import HTTPError, URLError
+from urllib.parse import unquote, urlsplit
 
 from app.core.config import get_settings
+from app.core.jsonutil import dumps_bytes, loads
+
+
+_JSON_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You must output a single JSON object and nothing else.",
+}
+
+
+# Request bodies below this size are sent uncompressed; gzip overhead outweighs the saving.
+_GZIP_MIN_BYTES = 1024
+
+# Response bodies are read and inflated in chunks of this size.
+_READ_CHUNK_BYTES = 64 * 1024
+
+# A complete JSON string literal, a brace, or an unterminated string (bare quote).
+_JSON_SCAN_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}]|"', re.DOTALL)
+
+
+class RecoverableError(ValueError):
+    pass
+
+
+class UnrecoverableError(ValueError):
+    pass
 
 
 class LLMClient(ABC):
+    # Empty so subclasses that declare __slots__ (MockLLMClient) really drop the instance dict.
+    __slots__ = ()
+
     @abstractmethod
     def generate_json(self, prompt: str, schema: dict) -> Dict:
         raise NotImplementedError
@@ -16,6 +58,36 @@ class LLMClient(ABC):
         raise NotImplementedError
 
 
+class _ResponseCache:
+    def __init__(self, max_size: int, ttl_s: float) -> None:
+        self.max_size = max(1, int(max_size))
+        self.ttl_s = float(ttl_s)
+        self._items: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+        # Callers mutate returned plans, so never hand out the cached object itself.
+        return copy.deepcopy(value)
+
+    def put(self, key: str, value: Any) -> None:
+        if value is None:
+            return
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl_s, copy.deepcopy(value))
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
 class RealLLMClient(LLMClient):
     def __init__(self, *args, **kwargs) -> None:
         settings = get_settings()
@@ -24,69 +96,272 @@ class RealLLMClient(LLMClient):
         self.model = getattr(settings, "llm_model", "")
         self.timeout = getattr(settings, "llm_timeout", 30)
         self.max_retries = max(1, int(getattr(settings, "llm_max_retries", 1)))
+        self.max_parse_retries = max(1, int(getattr(settings, "llm_max_parse_retries", 1)))
+        self.retry_base_delay = float(getattr(settings, "llm_retry_base_delay_s", 0.5))
+        self.retry_max_delay = float(getattr(settings, "llm_retry_max_delay_s", 30.0))
         self.force_json = bool(getattr(settings, "llm_force_json", True))
         self.extract_json = bool(getattr(settings, "llm_extract_json", True))
+        # Not every OpenAI-compatible endpoint accepts compressed request bodies, so this is opt-in.
+        self.gzip_requests = bool(getattr(settings, "llm_gzip_requests", False))
+        self.temperature = 0
+        self._cache: Optional[_ResponseCache] = None
+        self._last_schema: Optional[Tuple[Optional[dict], str]] = None
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+        if getattr(settings, "llm_cache_enabled", False):
+            self._cache = _ResponseCache(
+                getattr(settings, "llm_cache_size", 1024),
+                getattr(settings, "llm_cache_ttl_s", 1800),
+            )
         if not self.base_url:
             raise ValueError("LLM base_url is empty")
         if not self.api_key:
             raise ValueError("LLM api_key is empty")
         if not self.model:
             raise ValueError("LLM model is empty")
+        self._url = urlsplit(f"{self.base_url}/chat/completions")
+        self._path = self._url.path or "/"
+        if self._url.query:
+            self._path = f"{self._path}?{self._url.query}"
+        self._headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+            "Accept-Encoding": "gzip",
+        }
+        self._gzip_headers = {**self._headers, "Content-Encoding": "gzip"}
+        # One keep-alive connection per thread, so sequential calls skip the TCP/TLS handshake.
+        self._local = threading.local()
+        # Running totals of prompt tokens and of those served from the provider's prefix cache.
+        self.usage_totals = {"prompt_tokens": 0, "cached_tokens": 0}
+        self._usage_lock = threading.Lock()
 
     def generate_json(self, prompt: str, schema: dict) -> Dict:
-        last_error: Exception | None = None
-        for _ in range(self.max_retries):
-            content = self._chat(prompt, require_json=True)
-            try:
-                return json.loads(content)
-            except json.JSONDecodeError as exc:
-                if self.extract_json:
-                    extracted = self._extract_json_object(content)
-                    if extracted is not None:
-                        try:
-                            return json.loads(extracted)
-                        except json.JSONDecodeError as nested_exc:
-                            last_error = nested_exc
-                            continue
-                last_error = exc
-                continue
+        cache_key = self._cache_key("json", prompt, schema)
+        if cache_key is not None:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+            return self._coalesced(cache_key, lambda: self._generate_json(prompt))
+        return self._generate_json(prompt)
+
+    def _generate_json(self, prompt: str) -> Dict:
+        # Unparseable output has its own max_parse_retries budget; it never uses up network retries.
+        return self._chat_with_backoff(prompt, require_json=True, parse=self._parse_json)
+
+    def _parse_json(self, content: str) -> Dict:
+        try:
+            return loads(content)
+        except json.JSONDecodeError as exc:
+            last_error: Exception = exc
+        if self.extract_json:
+            extracted = self._extract_json_object(content)
+            if extracted is not None:
+                try:
+                    return loads(extracted)
+                except json.JSONDecodeError as exc:
+                    last_error = exc
         raise ValueError(f"LLM output is not valid JSON: {last_error}") from last_error
 
     def generate_text(self, prompt: str) -> str:
-        return self._chat(prompt, require_json=False)
+        cache_key = self._cache_key("text", prompt, None)
+        if cache_key is not None:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+            return self._coalesced(
+                cache_key, lambda: self._chat_with_backoff(prompt, require_json=False)
+            )
+        return self._chat_with_backoff(prompt, require_json=False)
+
+    def _coalesced(self, cache_key: str, call: Callable[[], Any]) -> Any:
+        # Concurrent misses on the same key share one request; followers wait for the leader.
+        with self._inflight_lock:
+            future = self._inflight.get(cache_key)
+            leader = future is None
+            if leader:
+                future = self._inflight[cache_key] = Future()
+        if not leader:
+            return copy.deepcopy(future.result())
+        try:
+            result = call()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            self._cache.put(cache_key, result)
+            # The leader's caller may mutate its result, so followers copy from a private snapshot.
+            future.set_result(copy.deepcopy(result))
+            return result
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(cache_key, None)
+
+    def _cache_key(self, kind: str, prompt: str, schema: Optional[dict]) -> Optional[str]:
+        # Only deterministic (temperature 0) completions are safe to replay.
+        if self._cache is None or self.temperature != 0:
+            return None
+        raw = json.dumps([self.model, kind, prompt, self._schema_json(schema)], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _schema_json(self, schema: Optional[dict]) -> str:
+        # Callers pass the same schema object on every call; encode it once, not per cache key.
+        last = self._last_schema
+        if last is not None and last[0] is schema:
+            return last[1]
+        encoded = json.dumps(schema, sort_keys=True, ensure_ascii=False, default=str)
+        self._last_schema = (schema, encoded)
+        return encoded
+
+    def _chat_with_backoff(
+        self, prompt: str, require_json: bool, parse: Optional[Callable[[str], Any]] = None
+    ) -> Any:
+        # Separate counters, each for the whole call, so neither failure kind eats the other's
+        # retries and a call stays within max_retries + max_parse_retries requests.
+        network_failures = 0
+        parse_failures = 0
+        while True:
+            try:
+                content = self._chat(prompt, require_json)
+            except RecoverableError:
+                network_failures += 1
+                if network_failures >= self.max_retries:
+                    raise
+                time.sleep(self._backoff_delay(network_failures - 1))
+                continue
+            if parse is None:
+                return content
+            try:
+                return parse(content)
+            except ValueError:
+                # A bad completion is not a server fault, so it is retried without backing off.
+                parse_failures += 1
+                if parse_failures >= self.max_parse_retries:
+                    raise
+
+    def _backoff_delay(self, attempt: int) -> float:
+        delay = self.retry_base_delay * (2 ** attempt) * (1 + random.random() * 0.5)
+        return min(delay, self.retry_max_delay)
 
     def _chat(self, prompt: str, require_json: bool) -> str:
-        url = f"{self.base_url}/chat/completions"
         messages = []
         if require_json and self.force_json:
-            messages.append(
-                {
-                    "role": "system",
-                    "content": "You must output a single JSON object and nothing else.",
-                }
-            )
+            messages.append(_JSON_SYSTEM_MESSAGE)
         messages.append({"role": "user", "content": prompt})
         payload = {
             "model": self.model,
             "messages": messages,
-            "temperature": 0,
-        }
-        data = json.dumps(payload).encode("utf-8")
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}",
+            "temperature": self.temperature,
         }
-        req = request.Request(url, data=data, headers=headers)
+        data = dumps_bytes(payload)
+        headers = self._headers
+        if self.gzip_requests and len(data) > _GZIP_MIN_BYTES:
+            data = gzip.compress(data)
+            headers = self._gzip_headers
         try:
-            with request.urlopen(req, timeout=self.timeout) as resp:
-                body = resp.read().decode("utf-8")
-        except (HTTPError, URLError) as exc:
-            raise ValueError(f"LLM request failed: {exc}") from exc
+            status, reason, raw = self._post(data, headers)
+        except (TimeoutError, ssl.SSLCertVerificationError) as exc:
+            # Timeouts are left to the caller (the planner retries them with a trimmed prompt).
+            raise UnrecoverableError(f"LLM request failed: {exc}") from exc
+        except (OSError, http.client.HTTPException) as exc:
+            raise RecoverableError(f"LLM request failed: {exc}") from exc
+        if status == 429 or status >= 500:
+            raise RecoverableError(f"LLM request failed: HTTP Error {status}: {reason}")
+        if status >= 400:
+            raise UnrecoverableError(f"LLM request failed: HTTP Error {status}: {reason}")
         try:
-            resp_json = json.loads(body)
-            return resp_json["choices"][0]["message"]["content"]
+            resp_json = loads(raw)
+            content = resp_json["choices"][0]["message"]["content"]
         except (KeyError, IndexError, json.JSONDecodeError) as exc:
-            raise ValueError("Invalid LLM response format") from exc
+            raise UnrecoverableError("Invalid LLM response format") from exc
+        self._record_usage(resp_json.get("usage"))
+        return content
+
+    def _record_usage(self, usage: Optional[Dict[str, Any]]) -> None:
+        if not isinstance(usage, dict):
+            return
+        details = usage.get("prompt_tokens_details") or {}
+        # OpenAI reports prompt_tokens_details.cached_tokens; DeepSeek-style APIs use prompt_cache_hit_tokens.
+        cached = details.get("cached_tokens") or usage.get("prompt_cache_hit_tokens") or 0
+        with self._usage_lock:
+            self.usage_totals["prompt_tokens"] += int(usage.get("prompt_tokens") or 0)
+            self.usage_totals["cached_tokens"] += int(cached)
+
+    def _post(self, data: bytes, headers: Dict[str, str]) -> Tuple[int, str, bytearray]:
+        conn = getattr(self._local, "conn", None)
+        reused = conn is not None
+        if conn is None:
+            conn = self._local.conn = self._new_connection()
+        try:
+            return self._send(conn, data, headers)
+        except (ConnectionError, http.client.RemoteDisconnected, http.client.BadStatusLine):
+            conn.close()
+            self._local.conn = None
+            if not reused:
+                raise
+        # The server dropped an idle keep-alive connection; retry once on a fresh one.
+        conn = self._local.conn = self._new_connection()
+        try:
+            return self._send(conn, data, headers)
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+
+    def _send(
+        self, conn: http.client.HTTPConnection, data: bytes, headers: Dict[str, str]
+    ) -> Tuple[int, str, bytearray]:
+        try:
+            conn.request("POST", self._path, body=data, headers=headers)
+            resp = conn.getresponse()
+            body = self._read_body(resp)
+        except Exception:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+            self._local.conn = None
+        return resp.status, resp.reason, body
+
+    @staticmethod
+    def _read_body(resp: http.client.HTTPResponse) -> bytearray:
+        # Read in chunks and inflate as they arrive, so a gzip body is never held twice in full.
+        decoder = None
+        if (resp.getheader("Content-Encoding") or "").lower() == "gzip":
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = bytearray()
+        try:
+            while True:
+                chunk = resp.read(_READ_CHUNK_BYTES)
+                if not chunk:
+                    break
+                body += decoder.decompress(chunk) if decoder is not None else chunk
+            if decoder is not None and body:
+                body += decoder.flush()
+                if not decoder.eof:
+                    raise EOFError("truncated gzip stream")
+        except (EOFError, zlib.error) as exc:
+            raise http.client.HTTPException(f"Invalid gzip response body: {exc}") from exc
+        return body
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        https = self._url.scheme == "https"
+        conn_cls = http.client.HTTPSConnection if https else http.client.HTTPConnection
+        host = self._url.hostname or ""
+        port = self._url.port or (443 if https else 80)
+        # Honour the same proxy environment variables urlopen would.
+        proxy = request.getproxies().get(self._url.scheme)
+        if proxy and not request.proxy_bypass(host):
+            proxy_url = urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+            conn = conn_cls(proxy_url.hostname, proxy_url.port or 80, timeout=self.timeout)
+            tunnel_headers = None
+            if proxy_url.username is not None:
+                # set_tunnel only takes host:port, so user:pass@ in the proxy URL is sent here.
+                credentials = f"{unquote(proxy_url.username)}:{unquote(proxy_url.password or '')}"
+                token = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+                tunnel_headers = {"Proxy-Authorization": f"Basic {token}"}
+            conn.set_tunnel(host, port, headers=tunnel_headers)
+            return conn
+        return conn_cls(host, port, timeout=self.timeout)
 
     @staticmethod
     def _extract_json_object(text: str) -> str | None:
@@ -96,12 +371,32 @@ class RealLLMClient(LLMClient):
         if start == -1:
             return None
         depth = 0
-        for idx in range(start, len(text)):
-            ch = text[idx]
-            if ch == "{":
+        # String literals are matched whole, so braces inside them never change the depth.
+        for match in _JSON_SCAN_RE.finditer(text, start):
+            token = match.group()
+            if token == "{":
                 depth += 1
-            elif ch == "}":
+            elif token == "}":
                 depth -= 1
                 if depth == 0:
-                    return text[start : idx + 1]
+                    return text[start : match.end()]
+            elif token == '"':
+                return None
         return None
+
+
+class AsyncRealLLMClient:
+    # Awaitable facade over RealLLMClient for fanning out several prompts with asyncio.gather.
+    # Each call runs on a worker thread, which keeps its own keep-alive connection, so the
+    # event loop is never blocked by the request or by backoff sleeps.
+    def __init__(self, client: Optional[RealLLMClient] = None, max_concurrency: int = 16) -> None:
+        self._client = client or RealLLMClient()
+        self._semaphore = asyncio.Semaphore(max(1, int(max_concurrency)))
+
+    async def generate_json(self, prompt: str, schema: dict) -> Dict:
+        async with self._semaphore:
+            return await asyncio.to_thread(self._client.generate_json, prompt, schema)
+
+    async def generate_text(self, prompt: str) -> str:
+        async with self._semaphore:
+            return await asyncio.to_thread(self._client.generate_text, prompt)
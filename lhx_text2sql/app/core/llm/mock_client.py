@@ -2,10 +2,104 @@ import json
 import re
 from typing import Dict, Optional
 
-from app.core.llm.client import LLMClient
+from app.core.llm.client import LLMClient, RealLLMClient
+
+# (question keyword, metric name hint, metric_id hint), checked in priority order.
+_METRIC_RULES = (
+    ("线损", "线损", "loss"),
+    ("负荷", "负荷", "load"),
+    ("停电", None, "outage"),
+    ("跳闸", None, "trip"),
+)
+_METRIC_RE = re.compile("|".join(re.escape(rule[0]) for rule in _METRIC_RULES))
+
+_INTENT_BY_KEYWORD = {
+    "排名": "rank",
+    "top": "rank",
+    "对比": "compare",
+    "同比": "compare",
+    "环比": "compare",
+    "明细": "detail",
+    "趋势": "trend",
+}
+_INTENT_PRIORITY = ("rank", "compare", "detail", "trend")
+_INTENT_RE = re.compile("|".join(map(re.escape, _INTENT_BY_KEYWORD)), re.IGNORECASE)
+
+_INPUTS_MARKER = "<INPUTS>"
+
+
+def _extract_inputs(prompt: str) -> Dict:
+    marker = prompt.find(_INPUTS_MARKER)
+    if marker != -1:
+        payload = prompt[marker + len(_INPUTS_MARKER) :]
+    else:
+        # No marker: take the first balanced JSON object in a single pass.
+        payload = RealLLMClient._extract_json_object(prompt)
+        if payload is None:
+            return {}
+    try:
+        return json.loads(payload)
+    except json.JSONDecodeError:
+        return {}
+
+
+def _pick_metric(metric_candidates, question: str) -> str:
+    if not metric_candidates:
+        return "UNKNOWN"
+    found = set(_METRIC_RE.findall(question))
+    for keyword, name_hint, id_hint in _METRIC_RULES:
+        if keyword not in found:
+            continue
+        match = next(
+            (
+                m
+                for m in metric_candidates
+                if (name_hint and name_hint in m.get("name", "")) or id_hint in m.get("metric_id", "")
+            ),
+            None,
+        )
+        if match is not None:
+            return match.get("metric_id")
+    return metric_candidates[0].get("metric_id")
+
+
+def _pick_intent(question: str) -> str:
+    found = {_INTENT_BY_KEYWORD[word.lower()] for word in _INTENT_RE.findall(question)}
+    for intent in _INTENT_PRIORITY:
+        if intent in found:
+            return intent
+    return "aggregate"
+
+
+def _pick_dimension(schema_candidates) -> Optional[Dict[str, str]]:
+    for item in schema_candidates:
+        if item.get("field", "").endswith("_name"):
+            return {"table": item.get("table"), "field": item.get("field")}
+    if schema_candidates:
+        item = schema_candidates[0]
+        return {"table": item.get("table"), "field": item.get("field")}
+    return None
+
+
+def _pick_sort(intent: str) -> Dict:
+    if intent == "rank":
+        return {"by": "metric", "order": "desc"}
+    if intent == "trend":
+        return {"by": "time_bucket", "order": "asc"}
+    return {"by": "metric", "order": "desc"}
+
+
+def _pick_output(intent: str) -> Dict:
+    if intent == "trend":
+        return {"format": "table", "chart_suggest": "line"}
+    if intent == "rank":
+        return {"format": "table", "chart_suggest": "bar"}
+    return {"format": "table", "chart_suggest": "none"}
 
 
 class MockLLMClient(LLMClient):
+    __slots__ = ("force_invalid", "force_sql")
+
     def __init__(self, force_invalid: bool = False, force_sql: bool = False) -> None:
         self.force_invalid = force_invalid
         self.force_sql = force_sql
@@ -14,7 +108,7 @@ class MockLLMClient(LLMClient):
         if self.force_invalid:
             return "SELECT * FROM t" if self.force_sql else "not json"
 
-        inputs = self._extract_inputs(prompt)
+        inputs = _extract_inputs(prompt)
         question = inputs.get("question", "")
         evidence = inputs.get("evidence", {})
         time_range = inputs.get("time_range") or {"start": "2024-01-01", "end": "2024-01-31"}
@@ -23,10 +117,10 @@ class MockLLMClient(LLMClient):
         schema_candidates = evidence.get("schema_candidates", [])
         join_paths = evidence.get("join_paths", [])
 
-        metric_id = self._pick_metric(metric_candidates, question)
-        intent = self._pick_intent(question)
+        metric_id = _pick_metric(metric_candidates, question)
+        intent = _pick_intent(question)
         join_path_id = join_paths[0]["join_path_id"] if join_paths else "NONE"
-        dimension = self._pick_dimension(schema_candidates)
+        dimension = _pick_dimension(schema_candidates)
 
         time_grain = "day"
         for metric in metric_candidates:
@@ -43,9 +137,9 @@ class MockLLMClient(LLMClient):
             "time_grain": time_grain,
             "filters": [],
             "join_path_id": join_path_id,
-            "sort": self._pick_sort(intent),
+            "sort": _pick_sort(intent),
             "limit": 10 if intent == "rank" else 200,
-            "output": self._pick_output(intent),
+            "output": _pick_output(intent),
             "confidence": 0.6,
             "clarifications": [],
         }
@@ -53,80 +147,3 @@ class MockLLMClient(LLMClient):
 
     def generate_text(self, prompt: str) -> str:
         return "这是示例回答，请接入真实 LLM 以获得更完整的自然语言答案。"
-
-    @staticmethod
-    def _extract_inputs(prompt: str) -> Dict:
-        marker = "<INPUTS>"
-        if marker in prompt:
-            payload = prompt.split(marker, 1)[1].strip()
-            try:
-                return json.loads(payload)
-            except json.JSONDecodeError:
-                return {}
-        match = re.search(r"(\{.*\})", prompt, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group(1))
-            except json.JSONDecodeError:
-                return {}
-        return {}
-
-    @staticmethod
-    def _pick_metric(metric_candidates, question: str) -> str:
-        if not metric_candidates:
-            return "UNKNOWN"
-        if "\u7ebf\u635f" in question:
-            for m in metric_candidates:
-                if "线损" in m.get("name", "") or "loss" in m.get("metric_id", ""):
-                    return m.get("metric_id")
-        if "\u8d1f\u8377" in question:
-            for m in metric_candidates:
-                if "负荷" in m.get("name", "") or "load" in m.get("metric_id", ""):
-                    return m.get("metric_id")
-        if "\u505c\u7535" in question:
-            for m in metric_candidates:
-                if "outage" in m.get("metric_id", ""):
-                    return m.get("metric_id")
-        if "\u8df3\u95f8" in question:
-            for m in metric_candidates:
-                if "trip" in m.get("metric_id", ""):
-                    return m.get("metric_id")
-        return metric_candidates[0].get("metric_id")
-
-    @staticmethod
-    def _pick_intent(question: str) -> str:
-        if "排名" in question or "top" in question.lower():
-            return "rank"
-        if "对比" in question or "\u540c\u6bd4" in question or "\u73af\u6bd4" in question:
-            return "compare"
-        if "明细" in question:
-            return "detail"
-        if "趋势" in question:
-            return "trend"
-        return "aggregate"
-
-    @staticmethod
-    def _pick_dimension(schema_candidates) -> Optional[Dict[str, str]]:
-        for item in schema_candidates:
-            if item.get("field", "").endswith("_name"):
-                return {"table": item.get("table"), "field": item.get("field")}
-        if schema_candidates:
-            item = schema_candidates[0]
-            return {"table": item.get("table"), "field": item.get("field")}
-        return None
-
-    @staticmethod
-    def _pick_sort(intent: str) -> Dict:
-        if intent == "rank":
-            return {"by": "metric", "order": "desc"}
-        if intent == "trend":
-            return {"by": "time_bucket", "order": "asc"}
-        return {"by": "metric", "order": "desc"}
-
-    @staticmethod
-    def _pick_output(intent: str) -> Dict:
-        if intent == "trend":
-            return {"format": "table", "chart_suggest": "line"}
-        if intent == "rank":
-            return {"format": "table", "chart_suggest": "bar"}
-        return {"format": "table", "chart_suggest": "none"}
@@ -0,0 +1,89 @@
+import copy
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from app.core.llm.client import LLMClient
+from app.core.rag.faiss_store import SimpleInMemoryVectorStore
+
+_INPUTS_MARKER = "\n<INPUTS>\n"
+# Parts of a question that change the plan while barely moving the token cosine (every CJK
+# character is its own token): numbers, ASCII identifiers, ranking/ordering words, and the
+# time, period, comparison and negation characters (上月 vs 本月, 环比 vs 同比, 不 ...).
+_EXACT_TOKEN_RE = re.compile(
+    r"\d+(?:\.\d+)?|[a-z_][a-z0-9_]*|最高|最低|最多|最少|最大|最小|升序|降序"
+    r"|[前后上下本今去明昨同环不非未无没日天周月季年]"
+)
+
+
+class SemanticCacheLLMClient(LLMClient):
+    # Replays a previous plan when everything in the prompt except the question is identical
+    # (template, evidence, time range, user context) and the question is a close paraphrase.
+    def __init__(
+        self,
+        inner: LLMClient,
+        threshold: float = 0.93,
+        max_contexts: int = 256,
+        max_questions: int = 64,
+    ) -> None:
+        self.inner = inner
+        self.threshold = threshold
+        self.max_contexts = max(1, int(max_contexts))
+        self.max_questions = max(1, int(max_questions))
+        self._stores: "OrderedDict[str, Tuple[SimpleInMemoryVectorStore, Set[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def generate_json(self, prompt: str, schema: dict) -> Dict:
+        split = self._split_prompt(prompt, schema)
+        if split is None:
+            return self.inner.generate_json(prompt, schema)
+        context_key, question = split
+        with self._lock:
+            entry = self._stores.get(context_key)
+            if entry is not None:
+                self._stores.move_to_end(context_key)
+                hits = entry[0].query(question, top_k=1)
+                if hits and hits[0].score >= self.threshold:
+                    return copy.deepcopy(hits[0].metadata["result"])
+
+        result = self.inner.generate_json(prompt, schema)
+        if isinstance(result, dict):
+            self._remember(context_key, question, result)
+        return result
+
+    def generate_text(self, prompt: str) -> str:
+        return self.inner.generate_text(prompt)
+
+    def _remember(self, context_key: str, question: str, result: Dict) -> None:
+        with self._lock:
+            entry = self._stores.get(context_key)
+            if entry is None:
+                entry = self._stores[context_key] = (SimpleInMemoryVectorStore(), set())
+                if len(self._stores) > self.max_contexts:
+                    self._stores.popitem(last=False)
+            store, questions = entry
+            if question in questions or len(questions) >= self.max_questions:
+                return
+            questions.add(question)
+            store.upsert(question, question, {"result": copy.deepcopy(result)})
+
+    def _split_prompt(self, prompt: str, schema: dict) -> Optional[Tuple[str, str]]:
+        if getattr(self.inner, "temperature", 0) != 0 or _INPUTS_MARKER not in prompt:
+            return None
+        template, raw_inputs = prompt.split(_INPUTS_MARKER, 1)
+        try:
+            inputs: Dict[str, Any] = json.loads(raw_inputs)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(inputs, dict) or not isinstance(inputs.get("question"), str):
+            return None
+        question = inputs.pop("question")
+        # Only questions with the same exact tokens share a store, so "前10" never matches "前20"/"后10".
+        exact = _EXACT_TOKEN_RE.findall(question.casefold())
+        context = json.dumps(
+            [template, inputs, schema, exact], sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(context.encode("utf-8")).hexdigest(), question
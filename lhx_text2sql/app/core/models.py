@@ -1,6 +1,7 @@
-from typing import Any, Dict, List, Optional, Literal
+import sys
+from typing import Any, Dict, FrozenSet, List, Optional, Literal
 
-from pydantic import BaseModel, Field, conint, confloat
+from pydantic import BaseModel, Field, PrivateAttr, conint, confloat, validator
 
 
 class Dimension(BaseModel):
@@ -65,6 +66,37 @@ class PlanDSL(BaseModel):
     class Config:
         extra = "forbid"
 
+    @classmethod
+    def from_validated(cls, plan: Dict[str, Any]) -> "PlanDSL":
+        # For plans that already passed plan_dsl.schema.json, which encodes the same
+        # constraints as these models; skips pydantic's second field-by-field validation.
+        sort = plan.get("sort")
+        limit = plan.get("limit")
+        errors_unresolved = plan.get("errors_unresolved")
+        return cls.construct(
+            version=plan["version"],
+            intent=plan["intent"],
+            metric_id=plan["metric_id"],
+            metric_params=dict(plan.get("metric_params") or {}),
+            dimensions=[Dimension.construct(**dim) for dim in plan["dimensions"]],
+            time_range=TimeRange.construct(**plan["time_range"]),
+            time_grain=plan["time_grain"],
+            filters=[Filter.construct(**fil) for fil in plan["filters"]],
+            join_path_id=plan["join_path_id"],
+            sort=SortSpec.construct(**sort) if sort is not None else None,
+            limit=int(limit) if limit is not None else None,
+            output=OutputSpec.construct(**plan["output"]),
+            confidence=float(plan["confidence"]),
+            clarifications=list(plan["clarifications"]),
+            errors_unresolved=list(errors_unresolved) if errors_unresolved is not None else None,
+        )
+
+
+# KB identifiers are compared and hashed all over planning and validation; interning them
+# lets dict/set lookups between KB objects hit the identity fast path.
+def _intern(value: str) -> str:
+    return sys.intern(value)
+
 
 class MetricDef(BaseModel):
     metric_id: str
@@ -75,8 +107,11 @@ class MetricDef(BaseModel):
     default_time_grain: str
     unit: str
 
+    _intern_ids = validator("metric_id", allow_reuse=True)(_intern)
+
     class Config:
         extra = "forbid"
+        copy_on_model_validation = "none"
 
 
 class SchemaEntity(BaseModel):
@@ -88,8 +123,26 @@ class SchemaEntity(BaseModel):
     data_type: str
     quality_tags: List[str]
 
+    _intern_ids = validator("table", "field", allow_reuse=True)(_intern)
+
+    _field_lc: Optional[str] = PrivateAttr(default=None)
+    _data_type_lc: Optional[str] = PrivateAttr(default=None)
+
     class Config:
         extra = "forbid"
+        copy_on_model_validation = "none"
+
+    @property
+    def field_lc(self) -> str:
+        if self._field_lc is None:
+            self._field_lc = self.field.lower()
+        return self._field_lc
+
+    @property
+    def data_type_lc(self) -> str:
+        if self._data_type_lc is None:
+            self._data_type_lc = self.data_type.lower()
+        return self._data_type_lc
 
 
 class JoinEdge(BaseModel):
@@ -99,8 +152,13 @@ class JoinEdge(BaseModel):
     right_field: str
     join_type: str
 
+    _intern_ids = validator(
+        "left_table", "left_field", "right_table", "right_field", allow_reuse=True
+    )(_intern)
+
     class Config:
         extra = "forbid"
+        copy_on_model_validation = "none"
 
 
 class JoinPath(BaseModel):
@@ -109,8 +167,18 @@ class JoinPath(BaseModel):
     tables: List[str]
     edges: List[JoinEdge]
 
+    _intern_ids = validator("join_path_id", "tables", each_item=True, allow_reuse=True)(_intern)
+
+    _table_set: Optional[FrozenSet[str]] = PrivateAttr(default=None)
+
     class Config:
         extra = "forbid"
+        copy_on_model_validation = "none"
+
+    def table_set(self) -> FrozenSet[str]:
+        if self._table_set is None:
+            self._table_set = frozenset(self.tables)
+        return self._table_set
 
 
 class TemplateRule(BaseModel):
@@ -120,8 +188,22 @@ class TemplateRule(BaseModel):
     allowed_funcs: List[str]
     required_clauses: List[str]
 
+    _allowed_agg_set: Optional[FrozenSet[str]] = PrivateAttr(default=None)
+    _allowed_func_set: Optional[FrozenSet[str]] = PrivateAttr(default=None)
+
     class Config:
         extra = "forbid"
+        copy_on_model_validation = "none"
+
+    def allowed_agg_set(self) -> FrozenSet[str]:
+        if self._allowed_agg_set is None:
+            self._allowed_agg_set = frozenset(self.allowed_aggs)
+        return self._allowed_agg_set
+
+    def allowed_func_set(self) -> FrozenSet[str]:
+        if self._allowed_func_set is None:
+            self._allowed_func_set = frozenset(self.allowed_funcs)
+        return self._allowed_func_set
 
 
 class EvidenceBundle(BaseModel):
@@ -130,9 +212,47 @@ class EvidenceBundle(BaseModel):
     join_paths: List[JoinPath]
     template_rules: List[TemplateRule]
 
+    _metric_by_id: Optional[Dict[str, MetricDef]] = PrivateAttr(default=None)
+    _join_path_by_id: Optional[Dict[str, JoinPath]] = PrivateAttr(default=None)
+    _as_dict: Optional[Dict[str, Any]] = PrivateAttr(default=None)
+
     class Config:
         extra = "forbid"
 
+    def replace(self, **changes: Any) -> "EvidenceBundle":
+        # Swap some candidate lists without re-validating the untouched ones. The values must
+        # already be model instances (KB rows or another bundle's lists).
+        bundle = self.copy(update=changes)
+        bundle._as_dict = None
+        if "metric_candidates" in changes:
+            bundle._metric_by_id = None
+        if "join_paths" in changes:
+            bundle._join_path_by_id = None
+        return bundle
+
+    def as_dict(self) -> Dict[str, Any]:
+        # Bundles are never mutated after construction, so the prompt payload is built once
+        # and shared; callers must treat it as read-only.
+        if self._as_dict is None:
+            self._as_dict = self.dict()
+        return self._as_dict
+
+    def get_metric(self, metric_id: str) -> Optional[MetricDef]:
+        if self._metric_by_id is None:
+            index: Dict[str, MetricDef] = {}
+            for metric in self.metric_candidates:
+                index.setdefault(metric.metric_id, metric)
+            self._metric_by_id = index
+        return self._metric_by_id.get(metric_id)
+
+    def get_join_path(self, join_path_id: str) -> Optional[JoinPath]:
+        if self._join_path_by_id is None:
+            index: Dict[str, JoinPath] = {}
+            for join_path in self.join_paths:
+                index.setdefault(join_path.join_path_id, join_path)
+            self._join_path_by_id = index
+        return self._join_path_by_id.get(join_path_id)
+
 
 class ValidationError(BaseModel):
     code: str
@@ -178,4 +298,4 @@ class QueryResponse(BaseModel):
     debug: DebugInfo
 
     class Config:
-        extra = "forbid"
+        extra = "forbid"
@@ -1,13 +1,22 @@
-import json
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Sequence
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick is optional; fall back to per-term substring checks.
+    ahocorasick = None
 
 from app.core.config import Settings
+from app.core.jsonutil import dumps
 from app.core.llm.client import LLMClient
-from app.core.models import EvidenceBundle, MetricDef, PlanDSL, ValidationError
+from app.core.models import EvidenceBundle, MetricDef, PlanDSL, SchemaEntity, ValidationError
 from app.core.planning.repair import PlanRepair
-from app.core.planning.validator import PlanValidator
+from app.core.prompt import load_prompt, load_prompt_prefix
+from app.core.planning.validator import TIME_DATA_TYPES, TIME_FIELD_NAMES, PlanValidator
 from app.core.rag.kb_join import JoinGraphKB
 from app.core.rag.kb_metric import MetricKB
 from app.core.rag.kb_schema import SchemaKB
@@ -19,6 +28,12 @@ SQL_KEYWORDS = re.compile(
     re.IGNORECASE,
 )
 
+_TOKEN_RE = re.compile(r"[a-zA-Z0-9_]+|[\u4e00-\u9fff]")
+
+
+def _is_time_field(item: SchemaEntity) -> bool:
+    return item.field_lc in TIME_FIELD_NAMES or item.data_type_lc in TIME_DATA_TYPES
+
 
 @dataclass
 class PlanResult:
@@ -51,12 +66,59 @@ class Planner:
         self.template_kb = template_kb
         self.validator = validator
         self.repairer = repairer
-        self.prompt_template = self._load_prompt(prompt_path)
-
-    @staticmethod
-    def _load_prompt(path: str) -> str:
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read()
+        self.prompt_template = load_prompt(prompt_path)
+        self._prompt_prefix = load_prompt_prefix(prompt_path)
+        self._trimmed_prompt_prefix = load_prompt_prefix(prompt_path, "<INPUTS_TRIMMED>")
+        # Lowercased match terms per KB row, built once instead of on every _parse_slots call.
+        self._metric_terms = [
+            (term, term.lower())
+            for metric in metric_kb.data
+            for term in (metric.metric_id, metric.name)
+            if term
+        ]
+        self._schema_terms = []
+        for item in schema_kb.data:
+            terms = tuple(t.lower() for t in [item.table, item.field, item.field_desc] + item.aliases if t)
+            self._schema_terms.append((f"{item.table}.{item.field}", item.table, terms))
+        self._term_automaton = self._build_term_automaton()
+        # Time-field checks for every KB row, done once. KB queries mostly return these same
+        # shared instances, but fall back to a fresh SchemaEntity for documents the KB did not
+        # load itself, so candidates are looked up by value rather than by identity.
+        self._time_flags = {
+            (item.table, item.field, item.data_type): _is_time_field(item) for item in schema_kb.data
+        }
+        self._time_fields = [item for item in schema_kb.data if _is_time_field(item)]
+        # Lowercased text each metric is scored against when auto-fixing an unknown metric_id,
+        # plus the metric-side halves of the keyword bonuses.
+        self._metric_search_texts = []
+        for metric in metric_kb.data:
+            text = " ".join(
+                [
+                    metric.metric_id,
+                    metric.name,
+                    metric.definition,
+                    metric.formula,
+                    " ".join(metric.required_fields),
+                ]
+            ).lower()
+            self._metric_search_texts.append(
+                (metric.metric_id, text, "amount" in text, "consumption" in text, "bills." in text)
+            )
+        # KBs are static after load, so identical retrievals can be replayed.
+        self._retrieval_cache_size = max(0, int(getattr(settings, "rag_cache_size", 0)))
+        self._retrieval_cache: "OrderedDict[Tuple, EvidenceBundle]" = OrderedDict()
+        self._retrieval_cache_lock = threading.Lock()
+        self.retrieval_cache_stats = {"hits": 0, "misses": 0}
+        # The four KB lookups are independent; stores backed by native code or a network
+        # service release the GIL, so they overlap instead of running back to back.
+        self._retrieval_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieve")
+        # Separate pool: prefetch tasks wait on the retrieval pool, so sharing it could deadlock.
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+
+    def close(self) -> None:
+        # Prefetches still queued are dropped; running ones finish before this returns.
+        self._prefetch_pool.shutdown(wait=True, cancel_futures=True)
+        self._retrieval_pool.shutdown(wait=True)
 
     def generate_plan(
         self,
@@ -66,48 +128,61 @@ class Planner:
     ) -> PlanResult:
         slots = self._parse_slots(question)
         evidence = self._retrieve(question, slots, self.settings.rag_top_k)
+        second_pass: Optional[Future] = None
         if self.settings.llm_mode == "no_llm":
             evidence = self._ensure_no_llm_evidence(evidence)
             plan = self._build_fixed_plan(evidence, time_range)
             plan_initial = plan
             validation_errors: List[ValidationError] = []
+            schema_checked = False
         else:
+            if self.settings.rag_prefetch_second_pass:
+                # Run the wider repair-round retrieval while the LLM call is in flight. It is only
+                # reused when the errors add no suggestions to the query, hence off by default.
+                second_pass = self._prefetch_pool.submit(
+                    self._retrieve, question, slots, self.settings.rag_top_k_second
+                )
             plan = self._call_llm(question, user_context, time_range, evidence)
             plan_initial = plan
             validation_errors = self.validator.validate(plan, evidence)
+            schema_checked = True
             if self._has_error(validation_errors, "metric_not_found"):
-                evidence = EvidenceBundle(
-                    metric_candidates=self.metric_kb.data,
-                    schema_candidates=evidence.schema_candidates,
-                    join_paths=evidence.join_paths,
-                    template_rules=evidence.template_rules,
-                )
-                fixed_metric_id = self._auto_fix_metric_id(question, self.metric_kb.data)
+                evidence = evidence.replace(metric_candidates=self.metric_kb.data)
+                fixed_metric_id = self._auto_fix_metric_id(question)
+                changed = {"evidence.metric_candidates"}
                 if fixed_metric_id:
                     plan["metric_id"] = fixed_metric_id
-                validation_errors = self.validator.validate(plan, evidence)
+                    changed.add("metric_id")
+                validation_errors = self.validator.validate_incremental(
+                    plan, evidence, validation_errors, changed
+                )
 
         if validation_errors:
             evidence = self._augment_evidence_for_errors(evidence, validation_errors)
             suggestions = self._collect_suggestions(validation_errors)
             refine_query = " ".join([question] + suggestions)
-            refine_slots = self._parse_slots(refine_query)
-            evidence = self._retrieve(
-                refine_query, refine_slots, self.settings.rag_top_k_second
-            )
+            if second_pass is not None and refine_query == question:
+                evidence = second_pass.result()
+            else:
+                refine_slots = self._parse_slots(refine_query)
+                evidence = self._retrieve(
+                    refine_query, refine_slots, self.settings.rag_top_k_second
+                )
             plan = self.repairer.repair(plan, [e.dict() for e in validation_errors], evidence)
             validation_errors = self.validator.validate(plan, evidence)
+            schema_checked = True
             if self._has_error(validation_errors, "metric_not_found"):
-                evidence = EvidenceBundle(
-                    metric_candidates=self.metric_kb.data,
-                    schema_candidates=evidence.schema_candidates,
-                    join_paths=evidence.join_paths,
-                    template_rules=evidence.template_rules,
-                )
-                fixed_metric_id = self._auto_fix_metric_id(question, self.metric_kb.data)
+                evidence = evidence.replace(metric_candidates=self.metric_kb.data)
+                fixed_metric_id = self._auto_fix_metric_id(question)
+                changed = {"evidence.metric_candidates"}
                 if fixed_metric_id:
                     plan["metric_id"] = fixed_metric_id
-                validation_errors = self.validator.validate(plan, evidence)
+                    changed.add("metric_id")
+                validation_errors = self.validator.validate_incremental(
+                    plan, evidence, validation_errors, changed
+                )
+        elif second_pass is not None:
+            second_pass.cancel()
 
         if validation_errors:
             raise ValueError(
@@ -115,10 +190,15 @@ class Planner:
                 + "; ".join([e.message for e in validation_errors])
             )
 
-        if self._contains_sql_keywords(json.dumps(plan, ensure_ascii=False)):
+        if self._plan_has_sql(plan):
             raise ValueError("LLM output contains SQL keywords")
 
-        plan_obj = PlanDSL.parse_obj(plan)
+        # Only a plan that passed the validator's schema check may skip pydantic validation;
+        # _build_fixed_plan output is never schema-checked and still needs parse_obj.
+        if schema_checked:
+            plan_obj = PlanDSL.from_validated(plan)
+        else:
+            plan_obj = PlanDSL.parse_obj(plan)
         metric_def = self._get_metric_def(plan_obj.metric_id, evidence)
         evidence_summary = self._summarize_evidence(evidence)
         return PlanResult(
@@ -141,9 +221,9 @@ class Planner:
             "question": question,
             "user_context": user_context,
             "time_range": time_range,
-            "evidence": evidence.dict(),
+            "evidence": evidence.as_dict(),
         }
-        prompt = f"{self.prompt_template}\n\n<INPUTS>\n{json.dumps(payload, ensure_ascii=False)}"
+        prompt = self._prompt_prefix + dumps(payload)
         try:
             plan = self.llm_client.generate_json(prompt=prompt, schema=self.validator.schema)
         except Exception as exc:
@@ -155,10 +235,7 @@ class Planner:
                     "time_range": time_range,
                     "evidence": trimmed,
                 }
-                small_prompt = (
-                    f"{self.prompt_template}\n\n<INPUTS_TRIMMED>\n"
-                    f"{json.dumps(small_payload, ensure_ascii=False)}"
-                )
+                small_prompt = self._trimmed_prompt_prefix + dumps(small_payload)
                 try:
                     plan = self.llm_client.generate_json(
                         prompt=small_prompt, schema=self.validator.schema
@@ -176,6 +253,26 @@ class Planner:
         return plan
 
     def _retrieve(self, text: str, slots: Dict[str, List[str]], top_k: int) -> EvidenceBundle:
+        if not self._retrieval_cache_size:
+            return self._retrieve_uncached(text, slots, top_k)
+        key = (text, tuple(sorted((k, tuple(v)) for k, v in slots.items())), top_k)
+        with self._retrieval_cache_lock:
+            cached = self._retrieval_cache.get(key)
+            if cached is not None:
+                self._retrieval_cache.move_to_end(key)
+                self.retrieval_cache_stats["hits"] += 1
+                return cached
+            self.retrieval_cache_stats["misses"] += 1
+        evidence = self._retrieve_uncached(text, slots, top_k)
+        with self._retrieval_cache_lock:
+            self._retrieval_cache[key] = evidence
+            while len(self._retrieval_cache) > self._retrieval_cache_size:
+                self._retrieval_cache.popitem(last=False)
+        return evidence
+
+    def _retrieve_uncached(
+        self, text: str, slots: Dict[str, List[str]], top_k: int
+    ) -> EvidenceBundle:
         metric_query = self._build_query(text, slots.get("metric_terms", []))
         schema_query = self._build_query(text, slots.get("schema_terms", []))
         join_query = self._build_query(
@@ -183,16 +280,18 @@ class Planner:
         )
         template_query = self._build_query(text, slots.get("intent_terms", []))
 
-        metric_candidates = self.metric_kb.query(metric_query, top_k=top_k)
-        schema_candidates = self.schema_kb.query(schema_query, top_k=top_k)
-        schema_candidates = self._ensure_time_fields(schema_candidates)
-        join_paths = self.join_kb.query(join_query, top_k=top_k)
-        template_rules = self.template_kb.query(template_query, top_k=top_k)
-        return EvidenceBundle(
-            metric_candidates=metric_candidates,
+        pool = self._retrieval_pool
+        metric_future = pool.submit(self.metric_kb.query, metric_query, top_k=top_k)
+        schema_future = pool.submit(self.schema_kb.query, schema_query, top_k=top_k)
+        join_future = pool.submit(self.join_kb.query, join_query, top_k=top_k)
+        template_future = pool.submit(self.template_kb.query, template_query, top_k=top_k)
+        schema_candidates = self._ensure_time_fields(schema_future.result())
+        # KB queries already return model instances, so skip pydantic's list re-validation.
+        return EvidenceBundle.construct(
+            metric_candidates=metric_future.result(),
             schema_candidates=schema_candidates,
-            join_paths=join_paths,
-            template_rules=template_rules,
+            join_paths=join_future.result(),
+            template_rules=template_future.result(),
         )
 
     @staticmethod
@@ -258,10 +357,8 @@ class Planner:
 
     @staticmethod
     def _collect_suggestions(errors: List[ValidationError]) -> List[str]:
-        suggestions: List[str] = []
-        for err in errors:
-            suggestions.extend(err.suggestions)
-        return suggestions[:8]
+        # Repeated suggestions add nothing to the refine query, so keep the first eight distinct ones.
+        return list(dict.fromkeys(s for err in errors for s in err.suggestions))[:8]
 
     @staticmethod
     def _summarize_evidence(evidence: EvidenceBundle) -> str:
@@ -275,12 +372,26 @@ class Planner:
     def _contains_sql_keywords(text: str) -> bool:
         return bool(SQL_KEYWORDS.search(text))
 
+    @staticmethod
+    def _plan_has_sql(obj: Any) -> bool:
+        # Scan string keys and leaves in place rather than serialising the whole plan first.
+        if isinstance(obj, str):
+            return SQL_KEYWORDS.search(obj) is not None
+        if isinstance(obj, dict):
+            return any(
+                Planner._plan_has_sql(key) or Planner._plan_has_sql(value)
+                for key, value in obj.items()
+            )
+        if isinstance(obj, list):
+            return any(Planner._plan_has_sql(item) for item in obj)
+        return False
+
     @staticmethod
     def _get_metric_def(metric_id: str, evidence: EvidenceBundle) -> MetricDef:
-        for metric in evidence.metric_candidates:
-            if metric.metric_id == metric_id:
-                return metric
-        raise ValueError("metric_id not found in evidence")
+        metric = evidence.get_metric(metric_id)
+        if metric is None:
+            raise ValueError("metric_id not found in evidence")
+        return metric
 
     def _build_fixed_plan(
         self, evidence: EvidenceBundle, time_range: Optional[Dict[str, str]]
@@ -302,7 +413,7 @@ class Planner:
         join_path_id = "NONE"
         if len(tables) > 1:
             for jp in evidence.join_paths:
-                if tables.issubset(set(jp.tables)):
+                if tables.issubset(jp.table_set()):
                     join_path_id = jp.join_path_id
                     break
             if join_path_id == "NONE":
@@ -339,23 +450,20 @@ class Planner:
         return evidence.metric_candidates[0]
 
     def _ensure_no_llm_evidence(self, evidence: EvidenceBundle) -> EvidenceBundle:
-        metric_candidates = evidence.metric_candidates or self.metric_kb.data
-        schema_candidates = evidence.schema_candidates or self.schema_kb.data
-        join_paths = evidence.join_paths or self.join_kb.data
-        template_rules = evidence.template_rules or self.template_kb.data
-        return EvidenceBundle(
-            metric_candidates=metric_candidates,
-            schema_candidates=schema_candidates,
-            join_paths=join_paths,
-            template_rules=template_rules,
-        )
-
-    @staticmethod
-    def _pick_time_table(evidence: EvidenceBundle) -> str:
+        changes: Dict[str, Any] = {}
+        if not evidence.metric_candidates:
+            changes["metric_candidates"] = self.metric_kb.data
+        if not evidence.schema_candidates:
+            changes["schema_candidates"] = self.schema_kb.data
+        if not evidence.join_paths:
+            changes["join_paths"] = self.join_kb.data
+        if not evidence.template_rules:
+            changes["template_rules"] = self.template_kb.data
+        return evidence.replace(**changes) if changes else evidence
+
+    def _pick_time_table(self, evidence: EvidenceBundle) -> str:
         for item in evidence.schema_candidates:
-            if item.field.lower() in {"ts", "timestamp", "event_time", "date", "dt"}:
-                return item.table
-            if item.data_type.lower() in {"datetime", "timestamp", "date"}:
+            if self._is_time_candidate(item):
                 return item.table
         return ""
 
@@ -369,30 +477,21 @@ class Planner:
             metric_candidates = self.metric_kb.data
         if "time_field_missing" in error_codes:
             schema_candidates = self._ensure_time_fields(schema_candidates, force_all=True)
-        return EvidenceBundle(
-            metric_candidates=metric_candidates,
-            schema_candidates=schema_candidates,
-            join_paths=evidence.join_paths,
-            template_rules=evidence.template_rules,
+        return evidence.replace(
+            metric_candidates=metric_candidates, schema_candidates=schema_candidates
         )
 
+    def _is_time_candidate(self, item: SchemaEntity) -> bool:
+        flag = self._time_flags.get((item.table, item.field, item.data_type))
+        return _is_time_field(item) if flag is None else flag
+
     def _ensure_time_fields(
         self, schema_candidates: List, force_all: bool = False
     ) -> List:
-        if not force_all and any(
-            item.field.lower() in {"ts", "timestamp", "event_time", "date", "dt"}
-            or item.data_type.lower() in {"datetime", "timestamp", "date"}
-            for item in schema_candidates
-        ):
+        if not force_all and any(self._is_time_candidate(item) for item in schema_candidates):
             return schema_candidates
-        time_fields = [
-            item
-            for item in self.schema_kb.data
-            if item.field.lower() in {"ts", "timestamp", "event_time", "date", "dt"}
-            or item.data_type.lower() in {"datetime", "timestamp", "date"}
-        ]
         merged = {f"{i.table}.{i.field}": i for i in schema_candidates}
-        for item in time_fields:
+        for item in self._time_fields:
             merged.setdefault(f"{item.table}.{item.field}", item)
         return list(merged.values())
 
@@ -403,18 +502,22 @@ class Planner:
         object_terms: List[str] = []
         intent_terms: List[str] = []
 
-        for metric in self.metric_kb.data:
-            for term in [metric.metric_id, metric.name]:
-                if term and term.lower() in norm:
+        if self._term_automaton is not None:
+            metric_hits, schema_hits = self._match_terms(norm)
+            metric_terms = [self._metric_terms[idx][0] for idx in metric_hits]
+            for idx in schema_hits:
+                field_key, table, _ = self._schema_terms[idx]
+                schema_terms.append(field_key)
+                object_terms.append(table)
+        else:
+            for term, term_lc in self._metric_terms:
+                if term_lc in norm:
                     metric_terms.append(term)
 
-        for item in self.schema_kb.data:
-            candidates: Sequence[str] = (
-                [item.table, item.field, item.field_desc] + item.aliases
-            )
-            if any(term and term.lower() in norm for term in candidates):
-                schema_terms.append(f"{item.table}.{item.field}")
-                object_terms.append(item.table)
+            for field_key, table, terms in self._schema_terms:
+                if any(term in norm for term in terms):
+                    schema_terms.append(field_key)
+                    object_terms.append(table)
 
         intent = self._detect_intent(norm)
         if intent:
@@ -427,6 +530,34 @@ class Planner:
             "intent_terms": intent_terms,
         }
 
+    def _build_term_automaton(self):
+        if ahocorasick is None:
+            return None
+        # Each lowercased term maps to every KB row it belongs to, as (is_metric, row index).
+        owners: Dict[str, List[Any]] = {}
+        for idx, (_, term_lc) in enumerate(self._metric_terms):
+            owners.setdefault(term_lc, []).append((True, idx))
+        for idx, (_, _, terms) in enumerate(self._schema_terms):
+            for term_lc in terms:
+                owners.setdefault(term_lc, []).append((False, idx))
+        if not owners:
+            return None
+        automaton = ahocorasick.Automaton()
+        for term_lc, rows in owners.items():
+            automaton.add_word(term_lc, rows)
+        automaton.make_automaton()
+        return automaton
+
+    def _match_terms(self, norm: str):
+        # One pass over the question finds every KB term in it; sorting the row indices
+        # keeps the same KB order the per-term scan produces.
+        metric_hits = set()
+        schema_hits = set()
+        for _, rows in self._term_automaton.iter(norm):
+            for is_metric, idx in rows:
+                (metric_hits if is_metric else schema_hits).add(idx)
+        return sorted(metric_hits), sorted(schema_hits)
+
     @staticmethod
     def _detect_intent(text: str) -> str:
         if any(k in text for k in ["\u6392\u540d", "top", "rank"]):
@@ -445,43 +576,31 @@ class Planner:
             return " ".join(terms + [text])
         return text
 
-    @staticmethod
-    def _auto_fix_metric_id(question: str, metrics: List[MetricDef]) -> str:
+    def _auto_fix_metric_id(self, question: str) -> str:
         q = question.lower()
+        tokens = [token for token in Planner._simple_tokens(q) if token]
+        # Question-side keyword checks do not depend on the metric, so settle them once.
+        wants_amount = any(k in q for k in ["金额", "费用", "cost", "amount"])
+        wants_consumption = any(k in q for k in ["用电量", "用电", "电量", "consumption", "kwh"])
+        wants_bills = "账单" in q
         best_score = -1
         best_id = ""
-        for metric in metrics:
-            score = 0
-            text = " ".join(
-                [
-                    metric.metric_id,
-                    metric.name,
-                    metric.definition,
-                    metric.formula,
-                    " ".join(metric.required_fields),
-                ]
-            ).lower()
-            for token in Planner._simple_tokens(q):
-                if token and token in text:
-                    score += 2
-            if any(k in q for k in ["金额", "费用", "cost", "amount"]) and (
-                "amount" in text or "total_amount" in text
-            ):
+        for metric_id, text, has_amount, has_consumption, has_bills in self._metric_search_texts:
+            score = 2 * sum(1 for token in tokens if token in text)
+            if wants_amount and has_amount:
                 score += 5
-            if any(k in q for k in ["用电量", "用电", "电量", "consumption", "kwh"]) and (
-                "consumption" in text
-            ):
+            if wants_consumption and has_consumption:
                 score += 5
-            if "账单" in q and "bills." in text:
+            if wants_bills and has_bills:
                 score += 3
             if score > best_score:
                 best_score = score
-                best_id = metric.metric_id
+                best_id = metric_id
         return best_id
 
     @staticmethod
     def _simple_tokens(text: str) -> List[str]:
-        return re.findall(r"[a-zA-Z0-9_]+|[\u4e00-\u9fff]", text)
+        return _TOKEN_RE.findall(text)
 
     @staticmethod
     def _has_error(errors: List[ValidationError], code: str) -> bool:
@@ -489,10 +608,4 @@ class Planner:
 
     @staticmethod
     def _dedupe(items: List[str]) -> List[str]:
-        seen = set()
-        output: List[str] = []
-        for item in items:
-            if item not in seen:
-                seen.add(item)
-                output.append(item)
-        return output
+        return list(dict.fromkeys(items))
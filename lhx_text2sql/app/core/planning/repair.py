@@ -1,29 +1,28 @@
-import json
 from typing import Dict, List
 
+from app.core.jsonutil import dumps
 from app.core.llm.client import LLMClient
+from app.core.prompt import load_prompt, load_prompt_prefix
 
 
 class PlanRepair:
     def __init__(self, llm_client: LLMClient, schema: dict, prompt_path: str) -> None:
         self.llm_client = llm_client
         self.schema = schema
-        self.prompt_template = self._load_prompt(prompt_path)
-
-    @staticmethod
-    def _load_prompt(path: str) -> str:
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read()
+        self.prompt_template = load_prompt(prompt_path)
+        self._prompt_prefix = load_prompt_prefix(prompt_path)
 
     def repair(self, original_plan: Dict, validation_errors: List[Dict], evidence) -> Dict:
+        # The schema never changes, so keep it ahead of the per-call fields to extend the
+        # prompt prefix that providers can serve from their prompt cache.
         payload = {
+            "schema": self.schema,
             "original_plan": original_plan,
             "validation_errors": validation_errors,
-            "evidence": evidence.dict(),
-            "schema": self.schema,
+            "evidence": evidence.as_dict(),
         }
-        prompt = f"{self.prompt_template}\n\n<INPUTS>\n{json.dumps(payload, ensure_ascii=False)}"
+        prompt = self._prompt_prefix + dumps(payload)
         plan = self.llm_client.generate_json(prompt=prompt, schema=self.schema)
         if not isinstance(plan, dict):
             raise ValueError("LLM repair output is not JSON")
-        return plan
+        return plan
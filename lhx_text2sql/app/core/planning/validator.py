@@ -1,17 +1,106 @@
 from datetime import date
-from typing import Dict, List
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
 
-from app.core.models import EvidenceBundle, ValidationError
-from app.core.schema import validate_plan
+from app.core.models import EvidenceBundle, SchemaEntity, ValidationError
+from app.core.schema import compile_validator, validate_plan
 
 
-TIME_FIELD_NAMES = {"ts", "timestamp", "event_time", "date", "dt"}
-TIME_DATA_TYPES = {"datetime", "timestamp", "date"}
+TIME_FIELD_NAMES = frozenset({"ts", "timestamp", "event_time", "date", "dt"})
+TIME_DATA_TYPES = frozenset({"datetime", "timestamp", "date"})
+_DATE_FORMAT_GRAINS = frozenset({"hour", "day", "month"})
+
+
+# Repair rounds resubmit the same time_range strings, so each is parsed once.
+@lru_cache(maxsize=256)
+def _parse_iso_date(value: str) -> Optional[date]:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+# Codes that mean the plan never reached the semantic rules, so nothing can be carried over.
+_STRUCTURAL_CODES = frozenset({"not_json", "schema"})
+
+
+class _Rule(NamedTuple):
+    check: Callable[[Dict, EvidenceBundle], List[ValidationError]]
+    # Top-level plan keys and "evidence.<list>" names the rule reads.
+    depends_on: FrozenSet[str]
+    # Error codes the rule emits, used to carry its previous errors over unchanged.
+    codes: FrozenSet[str]
 
 
 class PlanValidator:
     def __init__(self, schema: dict) -> None:
         self.schema = schema
+        self._schema_validator = compile_validator(schema)
+        self._property_validators = {
+            key: compile_validator(sub_schema)
+            for key, sub_schema in (schema.get("properties") or {}).items()
+        }
+        # Last schema_candidates list scanned and its {table: first time field}, in candidate order.
+        self._time_scan: Tuple[Optional[List[SchemaEntity]], Dict[str, SchemaEntity]] = (None, {})
+        # Run in this order; it fixes the order errors are reported in.
+        self._rules = (
+            _Rule(
+                self._check_metric,
+                frozenset({"metric_id", "evidence.metric_candidates"}),
+                frozenset({"metric_not_found"}),
+            ),
+            _Rule(
+                self._check_fields,
+                frozenset({"dimensions", "filters", "evidence.schema_candidates"}),
+                frozenset({"dimension_field_invalid", "filter_field_invalid"}),
+            ),
+            _Rule(
+                self._check_join,
+                frozenset(
+                    {
+                        "join_path_id",
+                        "dimensions",
+                        "filters",
+                        "metric_id",
+                        "evidence.metric_candidates",
+                        "evidence.schema_candidates",
+                        "evidence.join_paths",
+                    }
+                ),
+                frozenset({"join_path_not_found", "join_required", "join_path_unreachable"}),
+            ),
+            _Rule(
+                self._check_time_range,
+                frozenset({"time_range"}),
+                frozenset({"time_range_invalid", "time_range_missing"}),
+            ),
+            _Rule(
+                self._check_time_grain,
+                frozenset({"intent", "time_grain"}),
+                frozenset({"time_grain_required"}),
+            ),
+            _Rule(
+                self._check_time_field,
+                frozenset({"evidence.schema_candidates", "evidence.metric_candidates"}),
+                frozenset({"time_field_missing"}),
+            ),
+            _Rule(
+                self._check_template_rules,
+                frozenset(
+                    {
+                        "intent",
+                        "time_grain",
+                        "time_range",
+                        "sort",
+                        "limit",
+                        "metric_id",
+                        "evidence.template_rules",
+                        "evidence.metric_candidates",
+                    }
+                ),
+                frozenset({"function_not_allowed", "agg_not_allowed", "required_clause_missing"}),
+            ),
+        )
 
     def validate(self, plan: Dict, evidence: EvidenceBundle) -> List[ValidationError]:
         if not isinstance(plan, dict):
@@ -24,100 +113,161 @@ class PlanValidator:
                 )
             ]
 
-        errors = validate_plan(plan, self.schema)
+        errors = validate_plan(plan, self.schema, self._schema_validator)
         if errors:
             return errors
 
-        metric_ids = {m.metric_id for m in evidence.metric_candidates}
-        if plan.get("metric_id") not in metric_ids:
-            errors.append(
+        for rule in self._rules:
+            errors.extend(rule.check(plan, evidence))
+        return errors
+
+    def validate_incremental(
+        self,
+        plan: Dict,
+        evidence: EvidenceBundle,
+        previous_errors: List[ValidationError],
+        changed: Set[str],
+    ) -> List[ValidationError]:
+        # Re-runs only the rules that read a changed input and carries the other rules' errors
+        # over from previous_errors, which must come from validating this plan and evidence
+        # before the change. changed holds plan keys ("metric_id") and evidence lists
+        # ("evidence.metric_candidates").
+        if not isinstance(plan, dict) or any(e.code in _STRUCTURAL_CODES for e in previous_errors):
+            return self.validate(plan, evidence)
+        plan_keys = {key for key in changed if not key.startswith("evidence.")}
+        if any(key not in plan or key not in self._property_validators for key in plan_keys):
+            return self.validate(plan, evidence)
+
+        errors: List[ValidationError] = []
+        for key in sorted(plan_keys):
+            errors.extend(
                 ValidationError(
-                    code="metric_not_found",
-                    message="metric_id not in candidates",
-                    field_path="metric_id",
-                    suggestions=sorted(metric_ids),
+                    code="schema",
+                    message=err.message,
+                    field_path=".".join([key] + [str(p) for p in err.path]),
+                    suggestions=[],
                 )
+                for err in self._property_validators[key].iter_errors(plan[key])
             )
+        if errors:
+            return errors
 
-        schema_fields = {f"{s.table}.{s.field}" for s in evidence.schema_candidates}
-        for idx, dim in enumerate(plan.get("dimensions", [])):
-            key = f"{dim.get('table')}.{dim.get('field')}"
+        for rule in self._rules:
+            if rule.depends_on & changed:
+                errors.extend(rule.check(plan, evidence))
+            else:
+                errors.extend(e for e in previous_errors if e.code in rule.codes)
+        return errors
+
+    @staticmethod
+    def _check_metric(plan: Dict, evidence: EvidenceBundle) -> List[ValidationError]:
+        metric_ids = {m.metric_id for m in evidence.metric_candidates}
+        if plan.get("metric_id") in metric_ids:
+            return []
+        return [
+            ValidationError(
+                code="metric_not_found",
+                message="metric_id not in candidates",
+                field_path="metric_id",
+                suggestions=sorted(metric_ids),
+            )
+        ]
+
+    @staticmethod
+    def _check_fields(plan: Dict, evidence: EvidenceBundle) -> List[ValidationError]:
+        errors: List[ValidationError] = []
+        dimensions = plan.get("dimensions", [])
+        filters = plan.get("filters", [])
+        if not dimensions and not filters:
+            return errors
+        schema_fields = {(s.table, s.field) for s in evidence.schema_candidates}
+        # Sorted once, on the first miss, and shared by every dimension/filter error.
+        field_suggestions: Optional[List[str]] = None
+        for idx, dim in enumerate(dimensions):
+            key = (dim.get("table"), dim.get("field"))
             if key not in schema_fields:
+                if field_suggestions is None:
+                    field_suggestions = sorted(f"{t}.{f}" for t, f in schema_fields)[:5]
                 errors.append(
                     ValidationError(
                         code="dimension_field_invalid",
-                        message=f"Dimension field {key} not in schema candidates",
+                        message=f"Dimension field {key[0]}.{key[1]} not in schema candidates",
                         field_path=f"dimensions[{idx}]",
-                        suggestions=sorted(schema_fields)[:5],
+                        suggestions=field_suggestions,
                     )
                 )
 
-        for idx, fil in enumerate(plan.get("filters", [])):
-            key = f"{fil.get('table')}.{fil.get('field')}"
+        for idx, fil in enumerate(filters):
+            key = (fil.get("table"), fil.get("field"))
             if key not in schema_fields:
+                if field_suggestions is None:
+                    field_suggestions = sorted(f"{t}.{f}" for t, f in schema_fields)[:5]
                 errors.append(
                     ValidationError(
                         code="filter_field_invalid",
-                        message=f"Filter field {key} not in schema candidates",
+                        message=f"Filter field {key[0]}.{key[1]} not in schema candidates",
                         field_path=f"filters[{idx}]",
-                        suggestions=sorted(schema_fields)[:5],
+                        suggestions=field_suggestions,
                     )
                 )
+        return errors
 
+    def _check_join(self, plan: Dict, evidence: EvidenceBundle) -> List[ValidationError]:
         join_ids = {j.join_path_id for j in evidence.join_paths}
         join_path_id = plan.get("join_path_id")
         if join_path_id != "NONE" and join_path_id not in join_ids:
             referenced_tables = self._collect_tables(plan, evidence)
             suggestions = self._suggest_join_paths(referenced_tables, evidence) or sorted(join_ids)
-            errors.append(
+            return [
                 ValidationError(
                     code="join_path_not_found",
                     message="join_path_id not in candidates",
                     field_path="join_path_id",
                     suggestions=suggestions,
                 )
-            )
-        else:
-            join_errors = self._check_join_reachability(plan, evidence)
-            errors.extend(join_errors)
+            ]
+        return self._check_join_reachability(plan, evidence)
 
+    @staticmethod
+    def _check_time_range(plan: Dict, evidence: EvidenceBundle) -> List[ValidationError]:
         time_range = plan.get("time_range") or {}
         start = time_range.get("start")
         end = time_range.get("end")
-        if start and end:
-            try:
-                start_date = date.fromisoformat(start)
-                end_date = date.fromisoformat(end)
-                if start_date > end_date:
-                    errors.append(
-                        ValidationError(
-                            code="time_range_invalid",
-                            message="time_range.start is after end",
-                            field_path="time_range",
-                            suggestions=[],
-                        )
-                    )
-            except ValueError:
-                errors.append(
-                    ValidationError(
-                        code="time_range_invalid",
-                        message="time_range must be YYYY-MM-DD",
-                        field_path="time_range",
-                        suggestions=["YYYY-MM-DD"],
-                    )
-                )
-        else:
-            errors.append(
+        if not (start and end):
+            return [
                 ValidationError(
                     code="time_range_missing",
                     message="time_range is required",
                     field_path="time_range",
                     suggestions=[],
                 )
-            )
+            ]
+        start_date = _parse_iso_date(start)
+        end_date = _parse_iso_date(end)
+        if start_date is None or end_date is None:
+            return [
+                ValidationError(
+                    code="time_range_invalid",
+                    message="time_range must be YYYY-MM-DD",
+                    field_path="time_range",
+                    suggestions=["YYYY-MM-DD"],
+                )
+            ]
+        if start_date > end_date:
+            return [
+                ValidationError(
+                    code="time_range_invalid",
+                    message="time_range.start is after end",
+                    field_path="time_range",
+                    suggestions=[],
+                )
+            ]
+        return []
 
+    @staticmethod
+    def _check_time_grain(plan: Dict, evidence: EvidenceBundle) -> List[ValidationError]:
         if plan.get("intent") == "trend" and not plan.get("time_grain"):
-            errors.append(
+            return [
                 ValidationError(
                     code="time_grain_required",
                     message="time_grain required for trend intent",
@@ -130,30 +280,37 @@ class PlanValidator:
                         "month",
                     ],
                 )
-            )
+            ]
+        return []
 
-        if not self._has_time_field(evidence):
-            errors.append(
-                ValidationError(
-                    code="time_field_missing",
-                    message="No time field found in schema candidates",
-                    field_path="time_range",
-                    suggestions=[],
-                )
+    def _check_time_field(self, plan: Dict, evidence: EvidenceBundle) -> List[ValidationError]:
+        if self._has_time_field(evidence):
+            return []
+        return [
+            ValidationError(
+                code="time_field_missing",
+                message="No time field found in schema candidates",
+                field_path="time_range",
+                suggestions=[],
             )
+        ]
 
-        template_errors = self._check_template_rules(plan, evidence)
-        errors.extend(template_errors)
-
-        return errors
-
-    @staticmethod
-    def _has_time_field(evidence: EvidenceBundle) -> bool:
+    def _time_tables(self, evidence: EvidenceBundle) -> Dict[str, SchemaEntity]:
+        # One pass serves both _has_time_field and _pick_time_table; repair rounds usually
+        # keep the same schema_candidates list, so the scan is reused across validations.
+        candidates, time_tables = self._time_scan
+        if candidates is evidence.schema_candidates:
+            return time_tables
+        time_tables = {}
         for item in evidence.schema_candidates:
-            if item.field.lower() in TIME_FIELD_NAMES:
-                return True
-            if item.data_type.lower() in TIME_DATA_TYPES:
-                return True
+            if item.field_lc in TIME_FIELD_NAMES or item.data_type_lc in TIME_DATA_TYPES:
+                time_tables.setdefault(item.table, item)
+        self._time_scan = (evidence.schema_candidates, time_tables)
+        return time_tables
+
+    def _has_time_field(self, evidence: EvidenceBundle) -> bool:
+        if self._time_tables(evidence):
+            return True
         for metric in evidence.metric_candidates:
             for field in metric.required_fields:
                 if "." in field:
@@ -168,11 +325,14 @@ class PlanValidator:
     def _check_template_rules(plan: Dict, evidence: EvidenceBundle) -> List[ValidationError]:
         errors: List[ValidationError] = []
         intent = plan.get("intent")
-        for rule in evidence.template_rules:
-            if rule.intent != intent:
-                continue
-            required_funcs = PlanValidator._required_funcs(plan)
-            if required_funcs and not set(required_funcs).issubset(set(rule.allowed_funcs)):
+        rules = [rule for rule in evidence.template_rules if rule.intent == intent]
+        if not rules:
+            return errors
+        # What the plan needs does not depend on the rule it is checked against.
+        required_funcs = set(PlanValidator._required_funcs(plan))
+        required_aggs = set(PlanValidator._required_aggs(plan, evidence))
+        for rule in rules:
+            if required_funcs and not required_funcs.issubset(rule.allowed_func_set()):
                 errors.append(
                     ValidationError(
                         code="function_not_allowed",
@@ -181,8 +341,7 @@ class PlanValidator:
                         suggestions=rule.allowed_funcs,
                     )
                 )
-            required_aggs = PlanValidator._required_aggs(plan, evidence)
-            if required_aggs and not set(required_aggs).issubset(set(rule.allowed_aggs)):
+            if required_aggs and not required_aggs.issubset(rule.allowed_agg_set()):
                 errors.append(
                     ValidationError(
                         code="agg_not_allowed",
@@ -246,7 +405,7 @@ class PlanValidator:
         grain = plan.get("time_grain")
         if grain == "15m":
             return ["from_unixtime", "unix_timestamp"]
-        if grain in {"hour", "day", "month"}:
+        if grain in _DATE_FORMAT_GRAINS:
             return ["date_format"]
         if grain == "week":
             return ["yearweek"]
@@ -255,12 +414,9 @@ class PlanValidator:
     @staticmethod
     def _required_aggs(plan: Dict, evidence: EvidenceBundle) -> List[str]:
         metric_id = plan.get("metric_id")
-        if not metric_id:
+        if not metric_id or evidence.get_metric(metric_id) is None:
             return []
-        for metric in evidence.metric_candidates:
-            if metric.metric_id == metric_id:
-                return ["sum"]
-        return []
+        return ["sum"]
 
     def _check_join_reachability(
         self, plan: Dict, evidence: EvidenceBundle
@@ -284,10 +440,8 @@ class PlanValidator:
                 )
             return errors
 
-        join_path = next(
-            (jp for jp in evidence.join_paths if jp.join_path_id == join_path_id), None
-        )
-        if join_path and not referenced_tables.issubset(set(join_path.tables)):
+        join_path = evidence.get_join_path(join_path_id)
+        if join_path and not referenced_tables.issubset(join_path.table_set()):
             suggestions = self._suggest_join_paths(referenced_tables, evidence)
             errors.append(
                 ValidationError(
@@ -310,42 +464,31 @@ class PlanValidator:
             if table:
                 tables.add(table)
 
-        metric_id = plan.get("metric_id")
+        metric = evidence.get_metric(plan.get("metric_id"))
         metric_tables = set()
-        for metric in evidence.metric_candidates:
-            if metric.metric_id == metric_id:
-                for field in metric.required_fields:
-                    if "." in field:
-                        table, _ = field.split(".", 1)
-                        tables.add(table)
-                        metric_tables.add(table)
-                break
+        if metric is not None:
+            for field in metric.required_fields:
+                if "." in field:
+                    table, _ = field.split(".", 1)
+                    tables.add(table)
+                    metric_tables.add(table)
 
         time_table = self._pick_time_table(evidence, metric_tables)
         if time_table:
             tables.add(time_table)
         return tables
 
-    @staticmethod
-    def _pick_time_table(evidence: EvidenceBundle, preferred_tables: set) -> str:
-        if preferred_tables:
-            for item in evidence.schema_candidates:
-                if item.table in preferred_tables:
-                    if item.field.lower() in TIME_FIELD_NAMES:
-                        return item.table
-                    if item.data_type.lower() in TIME_DATA_TYPES:
-                        return item.table
-        for item in evidence.schema_candidates:
-            if item.field.lower() in TIME_FIELD_NAMES:
-                return item.table
-            if item.data_type.lower() in TIME_DATA_TYPES:
-                return item.table
-        return ""
+    def _pick_time_table(self, evidence: EvidenceBundle, preferred_tables: set) -> str:
+        time_tables = self._time_tables(evidence)
+        for table in time_tables:
+            if table in preferred_tables:
+                return table
+        return next(iter(time_tables), "")
 
     @staticmethod
     def _suggest_join_paths(referenced_tables: set, evidence: EvidenceBundle) -> List[str]:
         suggestions: List[str] = []
         for jp in evidence.join_paths:
-            if referenced_tables.issubset(set(jp.tables)):
+            if referenced_tables.issubset(jp.table_set()):
                 suggestions.append(jp.join_path_id)
         return suggestions
@@ -0,0 +1,22 @@
+import os
+from functools import lru_cache
+
+
+def load_prompt(path: str) -> str:
+    return _read_prompt(os.path.abspath(path))
+
+
+def load_prompt_prefix(path: str, marker: str = "<INPUTS>") -> str:
+    # Template plus the inputs marker, shared by every instance that uses the same prompt.
+    return _build_prefix(os.path.abspath(path), marker)
+
+
+@lru_cache(maxsize=32)
+def _read_prompt(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@lru_cache(maxsize=32)
+def _build_prefix(path: str, marker: str) -> str:
+    return f"{_read_prompt(path)}\n\n{marker}\n"
@@ -1,22 +1,51 @@
+import heapq
+import math
 import re
-from typing import Any, Dict, List, Optional
+from collections import Counter
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
 
 from app.core.rag.vector_store import Document, VectorStore
 
 
+_TOKEN_RE = re.compile(r"[a-zA-Z0-9_]+|[\u4e00-\u9fff]")
+# ASCII text cannot contain CJK characters, so it only needs the word alternative.
+_ASCII_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+
 def _tokenize(text: str) -> List[str]:
-    return re.findall(r"[a-zA-Z0-9_]+|[\u4e00-\u9fff]", text.lower())
+    if text.isascii():
+        return _ASCII_TOKEN_RE.findall(text if text.islower() else text.lower())
+    return _TOKEN_RE.findall(text.lower())
 
 
 class SimpleInMemoryVectorStore(VectorStore):
     def __init__(self) -> None:
         self._docs: Dict[str, Dict[str, Any]] = {}
-        self._tokens: Dict[str, set] = {}
+        # doc_id -> (tokens, sqrt(len(tokens))); the norm is fixed once the doc is stored.
+        self._tokens: Dict[str, Tuple[FrozenSet[str], float]] = {}
+        # token -> ids of the documents containing it; only those can score above zero.
+        self._postings: Dict[str, Set[str]] = {}
+        self._order: Dict[str, int] = {}
 
     def upsert(self, doc_id: str, text: str, metadata: Dict[str, Any]) -> None:
-        tokens = set(_tokenize(text))
+        self._store(doc_id, text, frozenset(_tokenize(text)), metadata)
+
+    def upsert_fields(self, doc_id: str, fields: Sequence[str], metadata: Dict[str, Any]) -> None:
+        # Tokenizing field by field keeps ASCII ids and names on the fast path even when
+        # another field of the same document holds Chinese text.
+        tokens = frozenset(token for field in fields for token in _tokenize(field))
+        self._store(doc_id, " ".join(fields), tokens, metadata)
+
+    def _store(
+        self, doc_id: str, text: str, tokens: FrozenSet[str], metadata: Dict[str, Any]
+    ) -> None:
+        for token in self._tokens.get(doc_id, (frozenset(), 0.0))[0]:
+            self._postings[token].discard(doc_id)
+        for token in tokens:
+            self._postings.setdefault(token, set()).add(doc_id)
         self._docs[doc_id] = {"text": text, "metadata": metadata}
-        self._tokens[doc_id] = tokens
+        self._tokens[doc_id] = (tokens, math.sqrt(len(tokens)))
+        self._order.setdefault(doc_id, len(self._order))
 
     def query(
         self, text: str, top_k: int = 5, filter: Optional[Dict[str, Any]] = None
@@ -24,28 +53,25 @@ class SimpleInMemoryVectorStore(VectorStore):
         q_tokens = set(_tokenize(text))
         if not q_tokens:
             return []
+        q_sqrt = math.sqrt(len(q_tokens))
+        # Walking the postings yields each candidate once per shared token: the overlap count.
+        inter_counts: Counter = Counter()
+        for token in q_tokens:
+            inter_counts.update(self._postings.get(token, ()))
         scored: List[Document] = []
-        for doc_id, tokens in self._tokens.items():
+        # Insertion order keeps ties ranked the same as a full scan would.
+        for doc_id in sorted(inter_counts, key=self._order.__getitem__):
             metadata = self._docs[doc_id]["metadata"]
             if filter:
                 if any(metadata.get(k) != v for k, v in filter.items()):
                     continue
-            score = self._cosine_sim(q_tokens, tokens)
-            if score > 0:
-                scored.append(
-                    Document(
-                        doc_id=doc_id,
-                        text=self._docs[doc_id]["text"],
-                        metadata=metadata,
-                        score=score,
-                    )
+            scored.append(
+                Document(
+                    doc_id=doc_id,
+                    text=self._docs[doc_id]["text"],
+                    metadata=metadata,
+                    score=inter_counts[doc_id] / (q_sqrt * self._tokens[doc_id][1]),
                 )
-        scored.sort(key=lambda d: d.score, reverse=True)
-        return scored[:top_k]
-
-    @staticmethod
-    def _cosine_sim(a: set, b: set) -> float:
-        if not a or not b:
-            return 0.0
-        inter = len(a & b)
-        return inter / ((len(a) ** 0.5) * (len(b) ** 0.5))
+            )
+        # nlargest keeps equal scores in input order, matching the stable sort it replaces.
+        return heapq.nlargest(top_k, scored, key=lambda d: d.score)
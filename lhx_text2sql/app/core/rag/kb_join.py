@@ -1,6 +1,6 @@
 import json
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 from app.core.models import JoinPath
 from app.core.rag.vector_store import VectorStore
@@ -11,6 +11,7 @@ class JoinGraphKB:
         self.path = Path(path)
         self.store = store
         self.data: List[JoinPath] = []
+        self._by_doc_id: Dict[str, JoinPath] = {}
         self.graph: dict = {}
         self._load()
 
@@ -19,15 +20,10 @@ class JoinGraphKB:
         self.data = [JoinPath(**item) for item in raw]
         self.graph = {}
         for item in self.data:
-            text = " ".join(
-                [
-                    item.join_path_id,
-                    item.description,
-                    " ".join(item.tables),
-                ]
-            )
+            fields = [item.join_path_id, item.description, *item.tables]
             doc_id = f"join::{item.join_path_id}"
-            self.store.upsert(doc_id, text, item.dict())
+            self.store.upsert_fields(doc_id, fields, item.dict())
+            self._by_doc_id[doc_id] = item
             for edge in item.edges:
                 self._add_edge(edge.left_table, edge.right_table)
                 self._add_edge(edge.right_table, edge.left_table)
@@ -39,4 +35,4 @@ class JoinGraphKB:
 
     def query(self, text: str, top_k: int = 5) -> List[JoinPath]:
         docs = self.store.query(text, top_k=top_k)
-        return [JoinPath(**doc.metadata) for doc in docs]
+        return [self._by_doc_id.get(doc.doc_id) or JoinPath(**doc.metadata) for doc in docs]
@@ -1,6 +1,6 @@
 import json
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 from app.core.models import MetricDef
 from app.core.rag.vector_store import VectorStore
@@ -11,26 +11,27 @@ class MetricKB:
         self.path = Path(path)
         self.store = store
         self.data: List[MetricDef] = []
+        # doc_id -> loaded model, so query hits reuse it instead of re-validating metadata.
+        self._by_doc_id: Dict[str, MetricDef] = {}
         self._load()
 
     def _load(self) -> None:
         raw = json.loads(self.path.read_text(encoding="utf-8"))
         self.data = [MetricDef(**item) for item in raw]
         for item in self.data:
-            text = " ".join(
-                [
-                    item.metric_id,
-                    item.name,
-                    item.definition,
-                    item.formula,
-                    " ".join(item.required_fields),
-                    item.default_time_grain,
-                    item.unit,
-                ]
-            )
+            fields = [
+                item.metric_id,
+                item.name,
+                item.definition,
+                item.formula,
+                *item.required_fields,
+                item.default_time_grain,
+                item.unit,
+            ]
             doc_id = f"metric::{item.metric_id}"
-            self.store.upsert(doc_id, text, item.dict())
+            self.store.upsert_fields(doc_id, fields, item.dict())
+            self._by_doc_id[doc_id] = item
 
     def query(self, text: str, top_k: int = 5) -> List[MetricDef]:
         docs = self.store.query(text, top_k=top_k)
-        return [MetricDef(**doc.metadata) for doc in docs]
+        return [self._by_doc_id.get(doc.doc_id) or MetricDef(**doc.metadata) for doc in docs]
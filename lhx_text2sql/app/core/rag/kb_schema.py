@@ -1,6 +1,6 @@
 import json
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 from app.core.models import SchemaEntity
 from app.core.rag.vector_store import VectorStore
@@ -11,26 +11,26 @@ class SchemaKB:
         self.path = Path(path)
         self.store = store
         self.data: List[SchemaEntity] = []
+        self._by_doc_id: Dict[str, SchemaEntity] = {}
         self._load()
 
     def _load(self) -> None:
         raw = json.loads(self.path.read_text(encoding="utf-8"))
         self.data = [SchemaEntity(**item) for item in raw]
         for item in self.data:
-            text = " ".join(
-                [
-                    item.table,
-                    item.field,
-                    item.field_desc,
-                    " ".join(item.aliases),
-                    item.unit,
-                    item.data_type,
-                    " ".join(item.quality_tags),
-                ]
-            )
+            fields = [
+                item.table,
+                item.field,
+                item.field_desc,
+                *item.aliases,
+                item.unit,
+                item.data_type,
+                *item.quality_tags,
+            ]
             doc_id = f"schema::{item.table}.{item.field}"
-            self.store.upsert(doc_id, text, item.dict())
+            self.store.upsert_fields(doc_id, fields, item.dict())
+            self._by_doc_id[doc_id] = item
 
     def query(self, text: str, top_k: int = 5) -> List[SchemaEntity]:
         docs = self.store.query(text, top_k=top_k)
-        return [SchemaEntity(**doc.metadata) for doc in docs]
+        return [self._by_doc_id.get(doc.doc_id) or SchemaEntity(**doc.metadata) for doc in docs]
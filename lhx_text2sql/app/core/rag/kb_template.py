@@ -1,6 +1,6 @@
 import json
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 from app.core.models import TemplateRule
 from app.core.rag.vector_store import VectorStore
@@ -11,24 +11,24 @@ class TemplateKB:
         self.path = Path(path)
         self.store = store
         self.data: List[TemplateRule] = []
+        self._by_doc_id: Dict[str, TemplateRule] = {}
         self._load()
 
     def _load(self) -> None:
         raw = json.loads(self.path.read_text(encoding="utf-8"))
         self.data = [TemplateRule(**item) for item in raw]
         for item in self.data:
-            text = " ".join(
-                [
-                    item.template_id,
-                    item.intent,
-                    " ".join(item.allowed_aggs),
-                    " ".join(item.allowed_funcs),
-                    " ".join(item.required_clauses),
-                ]
-            )
+            fields = [
+                item.template_id,
+                item.intent,
+                *item.allowed_aggs,
+                *item.allowed_funcs,
+                *item.required_clauses,
+            ]
             doc_id = f"template::{item.template_id}"
-            self.store.upsert(doc_id, text, item.dict())
+            self.store.upsert_fields(doc_id, fields, item.dict())
+            self._by_doc_id[doc_id] = item
 
     def query(self, text: str, top_k: int = 5) -> List[TemplateRule]:
         docs = self.store.query(text, top_k=top_k)
-        return [TemplateRule(**doc.metadata) for doc in docs]
+        return [self._by_doc_id.get(doc.doc_id) or TemplateRule(**doc.metadata) for doc in docs]
@@ -1,9 +1,9 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence
 
 
-@dataclass
+@dataclass(slots=True)
 class Document:
     doc_id: str
     text: str
@@ -16,8 +16,11 @@ class VectorStore(ABC):
     def upsert(self, doc_id: str, text: str, metadata: Dict[str, Any]) -> None:
         raise NotImplementedError
 
+    def upsert_fields(self, doc_id: str, fields: Sequence[str], metadata: Dict[str, Any]) -> None:
+        self.upsert(doc_id, " ".join(fields), metadata)
+
     @abstractmethod
     def query(
         self, text: str, top_k: int = 5, filter: Optional[Dict[str, Any]] = None
     ) -> List[Document]:
-        raise NotImplementedError
+        raise NotImplementedError
@@ -1,18 +1,137 @@
+import copy
 import json
-from typing import List
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, List, Optional
 
 from jsonschema import Draft7Validator
 
+try:
+    import fastjsonschema
+except ImportError:  # fastjsonschema is optional; every plan then goes through Draft7Validator.
+    fastjsonschema = None
+
 from app.core.models import ValidationError
 
 
+def _readonly(self, *args, **kwargs):
+    raise TypeError("schemas from load_schema are shared and read-only; deepcopy one to edit it")
+
+
+class _FrozenDict(dict):
+    # A dict (so jsonschema, fastjsonschema and the JSON encoders take it as-is) that refuses
+    # mutation. cache_key names it for the compiled-validator caches: path plus JSON pointer.
+    __slots__ = ("cache_key",)
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self) -> dict:
+        return dict(self)
+
+    def __deepcopy__(self, memo: dict) -> dict:
+        return {key: copy.deepcopy(value, memo) for key, value in self.items()}
+
+
+class _FrozenList(list):
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __copy__(self) -> list:
+        return list(self)
+
+    def __deepcopy__(self, memo: dict) -> list:
+        return [copy.deepcopy(value, memo) for value in self]
+
+
+def _escape_pointer(key: str) -> str:
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def _freeze(value: Any, pointer: str) -> Any:
+    if isinstance(value, dict):
+        frozen = _FrozenDict(
+            (key, _freeze(item, f"{pointer}/{_escape_pointer(key)}")) for key, item in value.items()
+        )
+        frozen.cache_key = pointer
+        return frozen
+    if isinstance(value, list):
+        return _FrozenList(_freeze(item, f"{pointer}/{idx}") for idx, item in enumerate(value))
+    return value
+
+
+# Every caller shares one parsed schema per path, so it is handed out read-only.
+@lru_cache(maxsize=8)
 def load_schema(path: str) -> dict:
     with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+        return _freeze(json.load(f), f"{os.path.abspath(path)}#")
+
+
+def _cache_key(schema: dict) -> str:
+    # Loaded schemas (and their sub-schemas) are keyed by path; any other dict by its content,
+    # so a caller mutating its own dict gets a fresh validator rather than a stale one.
+    key = getattr(schema, "cache_key", None)
+    if key is None:
+        key = json.dumps(schema, sort_keys=True, ensure_ascii=False, default=str)
+    return key
+
+
+_COMPILED_CACHE_SIZE = 64
+_compiled_lock = threading.Lock()
+_VALIDATOR_CACHE: "OrderedDict[str, Draft7Validator]" = OrderedDict()
+# Same keying as _VALIDATOR_CACHE, for the generated fast-path checkers.
+_FAST_CHECK_CACHE: "OrderedDict[str, Optional[Callable[[Any], Any]]]" = OrderedDict()
+
+
+def _compiled(cache: OrderedDict, schema: dict, build: Callable[[dict], Any]) -> Any:
+    key = _cache_key(schema)
+    with _compiled_lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    compiled = build(schema)
+    with _compiled_lock:
+        cache[key] = compiled
+        while len(cache) > _COMPILED_CACHE_SIZE:
+            cache.popitem(last=False)
+    return compiled
+
+
+def _build_validator(schema: dict) -> Draft7Validator:
+    Draft7Validator.check_schema(schema)
+    return Draft7Validator(schema)
+
+
+def compile_validator(schema: dict) -> Draft7Validator:
+    return _compiled(_VALIDATOR_CACHE, schema, _build_validator)
+
+
+def compile_fast_check(schema: dict) -> Optional[Callable[[Any], Any]]:
+    # fastjsonschema generates straight-line Python for the schema, but stops at the first
+    # error; it only answers "valid or not", and Draft7Validator still reports the errors.
+    if fastjsonschema is None:
+        return None
+    return _compiled(
+        _FAST_CHECK_CACHE, schema, lambda definition: fastjsonschema.compile(definition, use_default=False)
+    )
 
 
-def validate_plan(plan: dict, schema: dict) -> List[ValidationError]:
-    validator = Draft7Validator(schema)
+def validate_plan(
+    plan: dict, schema: dict, validator: Optional[Draft7Validator] = None
+) -> List[ValidationError]:
+    fast_check = compile_fast_check(schema)
+    if fast_check is not None:
+        try:
+            fast_check(plan)
+            return []
+        except fastjsonschema.JsonSchemaException:
+            pass
+    if validator is None:
+        validator = compile_validator(schema)
     errors: List[ValidationError] = []
     for err in validator.iter_errors(plan):
         field_path = ".".join([str(p) for p in err.path]) or "$"
@@ -24,4 +143,4 @@ def validate_plan(plan: dict, schema: dict) -> List[ValidationError]:
                 suggestions=[],
             )
         )
-    return errors
+    return errors
@@ -1,18 +1,25 @@
 import json
 from pathlib import Path
 
-
-NUMERIC_TYPES = {
-    "int",
-    "bigint",
-    "smallint",
-    "mediumint",
-    "tinyint",
-    "decimal",
-    "float",
-    "double",
-    "numeric",
-}
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder.
+    orjson = None
+
+
+NUMERIC_TYPES = frozenset(
+    {
+        "int",
+        "bigint",
+        "smallint",
+        "mediumint",
+        "tinyint",
+        "decimal",
+        "float",
+        "double",
+        "numeric",
+    }
+)
 
 
 def _load_schema(path: str):
@@ -25,78 +32,87 @@ def _build_metric_name(prefix: str, field_desc: str, field: str) -> str:
     return f"{prefix}_{label}"
 
 
-def build_metrics(schema_items):
-    metrics = []
-    for item in schema_items:
-        data_type = (item.get("data_type") or "").lower()
-        if data_type not in NUMERIC_TYPES:
-            continue
-        table = item["table"]
-        field = item["field"]
-        field_desc = item.get("field_desc", "")
-        unit = item.get("unit", "")
-        for agg in ["sum", "avg", "max", "min"]:
-            metric_id = f"{agg}_{table}_{field}"
-            name = _build_metric_name(agg, field_desc, field)
-            formula = f"{agg.upper()}({field})"
-            metrics.append(
-                {
-                    "metric_id": metric_id,
-                    "name": name,
-                    "definition": f"{agg.upper()} of {table}.{field}",
-                    "formula": formula,
-                    "required_fields": [f"{table}.{field}"],
-                    "default_time_grain": "day",
-                    "unit": unit,
-                }
-            )
-    return metrics
+# (agg, SQL spelling); upper() is done once here instead of twice per metric.
+_AGGS = (("sum", "SUM"), ("avg", "AVG"), ("max", "MAX"), ("min", "MIN"))
 
 
-def build_templates():
+def build_metrics(schema_items):
+    numeric_items = [
+        (item["table"], item["field"], item.get("field_desc", ""), item.get("unit", ""))
+        for item in schema_items
+        if (item.get("data_type") or "").lower() in NUMERIC_TYPES
+    ]
     return [
         {
-            "template_id": "trend_template",
-            "intent": "trend",
-            "allowed_aggs": ["sum", "avg", "max", "min"],
-            "allowed_funcs": ["date_format", "yearweek", "from_unixtime", "unix_timestamp"],
-            "required_clauses": ["time_range", "time_grain", "group_by_time"],
-        },
-        {
-            "template_id": "rank_template",
-            "intent": "rank",
-            "allowed_aggs": ["sum", "avg", "max", "min"],
-            "allowed_funcs": [],
-            "required_clauses": ["order_by", "limit"],
-        },
-        {
-            "template_id": "aggregate_template",
-            "intent": "aggregate",
-            "allowed_aggs": ["sum", "avg", "max", "min"],
-            "allowed_funcs": [],
-            "required_clauses": ["time_range"],
-        },
-        {
-            "template_id": "compare_template",
-            "intent": "compare",
-            "allowed_aggs": ["sum", "avg", "max", "min"],
-            "allowed_funcs": ["date_format", "yearweek", "from_unixtime", "unix_timestamp"],
-            "required_clauses": ["time_range"],
-        },
+            "metric_id": f"{agg}_{table}_{field}",
+            "name": _build_metric_name(agg, field_desc, field),
+            "definition": f"{agg_sql} of {table}.{field}",
+            "formula": f"{agg_sql}({field})",
+            "required_fields": [f"{table}.{field}"],
+            "default_time_grain": "day",
+            "unit": unit,
+        }
+        for table, field, field_desc, unit in numeric_items
+        for agg, agg_sql in _AGGS
     ]
 
 
+# The generic templates do not depend on the schema; callers must not mutate them.
+_TEMPLATES = [
+    {
+        "template_id": "trend_template",
+        "intent": "trend",
+        "allowed_aggs": ["sum", "avg", "max", "min"],
+        "allowed_funcs": ["date_format", "yearweek", "from_unixtime", "unix_timestamp"],
+        "required_clauses": ["time_range", "time_grain", "group_by_time"],
+    },
+    {
+        "template_id": "rank_template",
+        "intent": "rank",
+        "allowed_aggs": ["sum", "avg", "max", "min"],
+        "allowed_funcs": [],
+        "required_clauses": ["order_by", "limit"],
+    },
+    {
+        "template_id": "aggregate_template",
+        "intent": "aggregate",
+        "allowed_aggs": ["sum", "avg", "max", "min"],
+        "allowed_funcs": [],
+        "required_clauses": ["time_range"],
+    },
+    {
+        "template_id": "compare_template",
+        "intent": "compare",
+        "allowed_aggs": ["sum", "avg", "max", "min"],
+        "allowed_funcs": ["date_format", "yearweek", "from_unixtime", "unix_timestamp"],
+        "required_clauses": ["time_range"],
+    },
+]
+
+
+def build_templates():
+    return _TEMPLATES
+
+
+# Fallback encoder, built once; same output as json.dumps(ensure_ascii=True, indent=2).
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=True, indent=2)
+
+
+def _write_json(path: str, obj) -> None:
+    # orjson keeps non-ASCII text as UTF-8 rather than \u escapes; both load the same.
+    if orjson is not None:
+        Path(path).write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        return
+    Path(path).write_text(_JSON_ENCODER.encode(obj), encoding="utf-8")
+
+
 def main() -> None:
     schema_items = _load_schema("data/schema_kb.json")
     metrics = build_metrics(schema_items)
     templates = build_templates()
 
-    Path("data/metric_kb.json").write_text(
-        json.dumps(metrics, ensure_ascii=True, indent=2), encoding="utf-8"
-    )
-    Path("data/template_kb.json").write_text(
-        json.dumps(templates, ensure_ascii=True, indent=2), encoding="utf-8"
-    )
+    _write_json("data/metric_kb.json", metrics)
+    _write_json("data/template_kb.json", templates)
 
     print("Updated:")
     print("- data/metric_kb.json (generic metrics)")
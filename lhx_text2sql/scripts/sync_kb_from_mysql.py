@@ -1,31 +1,55 @@
 import json
 import os
 from collections import defaultdict
-from typing import Dict, List, Tuple
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
 
 import pymysql
+from pymysql.constants import CLIENT
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder.
+    orjson = None
 
-TIME_FIELD_NAMES = {
-    "ts",
-    "timestamp",
-    "event_time",
-    "date",
-    "dt",
-    "created_at",
-    "updated_at",
-}
-NUMERIC_TYPES = {
-    "int",
-    "bigint",
-    "smallint",
-    "mediumint",
-    "tinyint",
-    "decimal",
-    "float",
-    "double",
-}
+
+TIME_FIELD_NAMES = frozenset(
+    {
+        "ts",
+        "timestamp",
+        "event_time",
+        "date",
+        "dt",
+        "created_at",
+        "updated_at",
+    }
+)
+TIME_DATA_TYPES = frozenset({"date", "datetime", "timestamp"})
+NUMERIC_TYPES = frozenset(
+    {
+        "int",
+        "bigint",
+        "smallint",
+        "mediumint",
+        "tinyint",
+        "decimal",
+        "float",
+        "double",
+    }
+)
+
+
+class Column(NamedTuple):
+    # One information_schema column; a tuple row instead of a per-column dict.
+    table: str
+    field: str
+    data_type: str
+    field_desc: str
+    column_key: str
+    is_fk: bool
+    is_numeric: bool
+    is_time: bool
 
 
 def _get_env(name: str, default: str = "") -> str:
@@ -49,39 +73,63 @@ def _connect() -> pymysql.connections.Connection:
         charset="utf8mb4",
         connect_timeout=5,
         read_timeout=10,
+        # Matches the server default, so connect() skips the SET AUTOCOMMIT round trip.
+        autocommit=True,
+        client_flag=CLIENT.MULTI_STATEMENTS,
     )
 
 
-def load_columns(conn: pymysql.connections.Connection, schema: str) -> List[Dict]:
-    sql = """
-        SELECT table_name,
-               column_name,
-               data_type,
-               column_comment,
-               column_key
-        FROM information_schema.columns
-        WHERE table_schema = %s
-        ORDER BY table_name, ordinal_position
+def _placeholders(values: List[str]) -> str:
+    return ", ".join(["%s"] * len(values))
+
+
+def _columns_query(schema: str) -> Tuple[str, Tuple]:
+    # The FK/numeric/time classification is done by the server, so build_schema_kb only
+    # reads flags. EXISTS rather than a join keeps one row per column for composite FKs.
+    numeric_types = sorted(NUMERIC_TYPES)
+    time_names = sorted(TIME_FIELD_NAMES)
+    time_types = sorted(TIME_DATA_TYPES)
+    sql = f"""
+        SELECT c.table_name,
+               c.column_name,
+               c.data_type,
+               c.column_comment,
+               c.column_key,
+               EXISTS (
+                   SELECT 1
+                   FROM information_schema.key_column_usage k
+                   WHERE k.table_schema = c.table_schema
+                     AND k.table_name = c.table_name
+                     AND k.column_name = c.column_name
+                     AND k.referenced_table_name IS NOT NULL
+               ) AS is_fk,
+               LOWER(c.data_type) IN ({_placeholders(numeric_types)}) AS is_numeric,
+               (
+                   LOWER(c.column_name) IN ({_placeholders(time_names)})
+                   OR LOWER(c.data_type) IN ({_placeholders(time_types)})
+               ) AS is_time
+        FROM information_schema.columns c
+        WHERE c.table_schema = %s
+        ORDER BY c.table_name, c.ordinal_position
     """
-    with conn.cursor() as cur:
-        cur.execute(sql, (schema,))
-        rows = cur.fetchall()
-    columns = []
-    for row in rows:
-        table, column, data_type, comment, column_key = row
-        columns.append(
-            {
-                "table": table,
-                "field": column,
-                "data_type": data_type or "",
-                "field_desc": comment or "",
-                "column_key": column_key or "",
-            }
-        )
-    return columns
+    return sql, (*numeric_types, *time_names, *time_types, schema)
 
 
-def load_foreign_keys(conn: pymysql.connections.Connection, schema: str) -> List[Dict]:
+def _column_item(row: Tuple) -> Column:
+    table, column, data_type, comment, column_key, is_fk, is_numeric, is_time = row
+    return Column(
+        table=table,
+        field=column,
+        data_type=(data_type or "").lower(),
+        field_desc=comment or "",
+        column_key=column_key or "",
+        is_fk=bool(is_fk),
+        is_numeric=bool(is_numeric),
+        is_time=bool(is_time),
+    )
+
+
+def _foreign_keys_query(schema: str) -> Tuple[str, Tuple]:
     sql = """
         SELECT table_name,
                column_name,
@@ -93,46 +141,68 @@ def load_foreign_keys(conn: pymysql.connections.Connection, schema: str) -> List
           AND referenced_column_name IS NOT NULL
         ORDER BY table_name, column_name
     """
-    with conn.cursor() as cur:
-        cur.execute(sql, (schema,))
-        rows = cur.fetchall()
-    fks = []
-    for row in rows:
-        table, column, ref_table, ref_column = row
-        fks.append(
-            {
-                "table": table,
-                "column": column,
-                "ref_table": ref_table,
-                "ref_column": ref_column,
-            }
-        )
-    return fks
+    return sql, (schema,)
+
+
+def _foreign_key_item(row: Tuple) -> Dict:
+    table, column, ref_table, ref_column = row
+    return {
+        "table": table,
+        "column": column,
+        "ref_table": ref_table,
+        "ref_column": ref_column,
+    }
+
+
+def load_columns(conn: pymysql.connections.Connection, schema: str) -> List[Column]:
+    # SSCursor streams rows from the server instead of buffering the whole result first.
+    with conn.cursor(pymysql.cursors.SSCursor) as cur:
+        cur.execute(*_columns_query(schema))
+        return [_column_item(row) for row in cur]
+
+
+def load_foreign_keys(conn: pymysql.connections.Connection, schema: str) -> List[Dict]:
+    with conn.cursor(pymysql.cursors.SSCursor) as cur:
+        cur.execute(*_foreign_keys_query(schema))
+        return [_foreign_key_item(row) for row in cur]
+
+
+def load_schema_metadata(
+    conn: pymysql.connections.Connection, schema: str
+) -> Tuple[List[Column], List[Dict]]:
+    # Both queries go out as one multi-statement request (the connection is opened with
+    # CLIENT.MULTI_STATEMENTS), so columns and foreign keys cost a single round trip.
+    columns_sql, columns_params = _columns_query(schema)
+    fks_sql, fks_params = _foreign_keys_query(schema)
+    sql = f"{columns_sql.strip()};\n{fks_sql.strip()}"
+    with conn.cursor(pymysql.cursors.SSCursor) as cur:
+        cur.execute(sql, (*columns_params, *fks_params))
+        columns = [_column_item(row) for row in cur]
+        cur.nextset()
+        fks = [_foreign_key_item(row) for row in cur]
+    return columns, fks
 
 
-def build_schema_kb(columns: List[Dict], fks: List[Dict]) -> List[Dict]:
-    fk_set = {(fk["table"], fk["column"]) for fk in fks}
+def build_schema_kb(columns: List[Column]) -> List[Dict]:
     items = []
     for col in columns:
-        data_type = (col.get("data_type") or "").lower()
-        field = col["field"]
         tags = []
-        if col.get("column_key") == "PRI":
+        if col.column_key == "PRI":
             tags.append("primary_key")
-        if (col["table"], field) in fk_set:
+        if col.is_fk:
             tags.append("foreign_key")
-        if field.lower() in TIME_FIELD_NAMES or data_type in {"date", "datetime", "timestamp"}:
+        if col.is_time:
             tags.append("time")
-        if data_type in NUMERIC_TYPES:
+        if col.is_numeric:
             tags.append("metric")
         items.append(
             {
-                "table": col["table"],
-                "field": field,
-                "field_desc": col.get("field_desc", ""),
+                "table": col.table,
+                "field": col.field,
+                "field_desc": col.field_desc,
                 "aliases": [],
                 "unit": "",
-                "data_type": data_type,
+                "data_type": col.data_type,
                 "quality_tags": tags,
             }
         )
@@ -141,14 +211,15 @@ def build_schema_kb(columns: List[Dict], fks: List[Dict]) -> List[Dict]:
 
 def build_join_kb(fks: List[Dict]) -> List[Dict]:
     items = []
+    # Suffixes number repeated (left, right) pairs in row order. One counter pass keeps the
+    # rows in their SQL order, where a sort-and-groupby would regroup them by pair.
     counter: Dict[Tuple[str, str], int] = defaultdict(int)
     for fk in fks:
         left = fk["table"]
         right = fk["ref_table"]
         key = (left, right)
-        counter[key] += 1
-        suffix = f"_{counter[key]}" if counter[key] > 1 else ""
-        join_id = f"{left}_{right}{suffix}"
+        seen = counter[key] = counter[key] + 1
+        join_id = f"{left}_{right}_{seen}" if seen > 1 else f"{left}_{right}"
         items.append(
             {
                 "join_path_id": join_id,
@@ -168,6 +239,18 @@ def build_join_kb(fks: List[Dict]) -> List[Dict]:
     return items
 
 
+# Fallback encoder, built once; same output as json.dumps(ensure_ascii=True, indent=2).
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=True, indent=2)
+
+
+def _write_json(path: str, obj) -> None:
+    # orjson keeps non-ASCII text as UTF-8 rather than \u escapes; both load the same.
+    if orjson is not None:
+        Path(path).write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        return
+    Path(path).write_text(_JSON_ENCODER.encode(obj), encoding="utf-8")
+
+
 def main() -> None:
     load_dotenv()
     schema = _get_env("TEXT2SQL_MYSQL_DATABASE", "")
@@ -175,18 +258,15 @@ def main() -> None:
         raise ValueError("TEXT2SQL_MYSQL_DATABASE is required in .env")
     conn = _connect()
     try:
-        columns = load_columns(conn, schema)
-        fks = load_foreign_keys(conn, schema)
+        columns, fks = load_schema_metadata(conn, schema)
     finally:
         conn.close()
 
-    schema_kb = build_schema_kb(columns, fks)
+    schema_kb = build_schema_kb(columns)
     join_kb = build_join_kb(fks)
 
-    with open("data/schema_kb.json", "w", encoding="utf-8") as f:
-        json.dump(schema_kb, f, ensure_ascii=True, indent=2)
-    with open("data/join_kb.json", "w", encoding="utf-8") as f:
-        json.dump(join_kb, f, ensure_ascii=True, indent=2)
+    _write_json("data/schema_kb.json", schema_kb)
+    _write_json("data/join_kb.json", join_kb)
 
     print("Updated:")
     print("- data/schema_kb.json")
@@ -0,0 +1,26 @@
+import pytest
+
+from app.core.config import get_settings
+from app.core.rag.faiss_store import SimpleInMemoryVectorStore
+from app.core.rag.kb_join import JoinGraphKB
+from app.core.rag.kb_metric import MetricKB
+from app.core.rag.kb_schema import SchemaKB
+from app.core.rag.kb_template import TemplateKB
+from app.core.schema import load_schema
+
+
+@pytest.fixture(scope="session")
+def plan_schema():
+    return load_schema("schemas/plan_dsl.schema.json")
+
+
+@pytest.fixture(scope="session")
+def knowledge_bases():
+    # Loading and indexing the KBs is the slow part of building a Planner; tests only read them.
+    settings = get_settings()
+    return {
+        "schema_kb": SchemaKB(settings.schema_kb_path, SimpleInMemoryVectorStore()),
+        "join_kb": JoinGraphKB(settings.join_kb_path, SimpleInMemoryVectorStore()),
+        "metric_kb": MetricKB(settings.metric_kb_path, SimpleInMemoryVectorStore()),
+        "template_kb": TemplateKB(settings.template_kb_path, SimpleInMemoryVectorStore()),
+    }
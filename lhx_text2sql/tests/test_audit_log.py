@@ -0,0 +1,86 @@
+import json
+import logging
+from datetime import date
+from decimal import Decimal
+
+from app.core.audit.audit_log import AuditLogger
+
+
+def test_audit_logger_flushes_batched_records(tmp_path):
+    path = tmp_path / "audit.jsonl"
+    logger = AuditLogger(str(path), batch_size=4, batch_ms=50)
+    for idx in range(10):
+        logger.write(
+            audit_id=f"id-{idx}",
+            question="q",
+            user_context={},
+            evidence_summary="",
+            plan_initial=None,
+            plan_final=None,
+            validation_errors=[],
+            sql=None,
+            elapsed_ms=idx,
+            error=None,
+        )
+    logger.close()
+
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [r["audit_log_id"] for r in records] == [f"id-{idx}" for idx in range(10)]
+    assert all("T" in r["timestamp"] and "+" not in r["timestamp"] for r in records)
+
+
+def test_audit_logger_survives_non_json_values(tmp_path):
+    path = tmp_path / "audit.jsonl"
+    logger = AuditLogger(str(path), batch_size=4, batch_ms=10)
+    for idx, context in enumerate([{"budget": Decimal("1.50"), "day": date(2024, 1, 2)}, {}]):
+        logger.write(
+            audit_id=f"id-{idx}",
+            question="q",
+            user_context=context,
+            evidence_summary="",
+            plan_initial=None,
+            plan_final=None,
+            validation_errors=[],
+            sql=None,
+            elapsed_ms=idx,
+            error=None,
+        )
+    logger.close()
+
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [r["audit_log_id"] for r in records] == ["id-0", "id-1"]
+    assert records[0]["user_context"] == {"budget": "1.50", "day": "2024-01-02"}
+
+
+class _FullDisk:
+    closed = False
+
+    def write(self, data):
+        raise OSError(28, "No space left on device")
+
+
+def test_audit_logger_logs_and_counts_dropped_batches(tmp_path, caplog):
+    path = tmp_path / "audit.jsonl"
+    logger = AuditLogger(str(path), batch_size=4, batch_ms=10)
+    real_fh, logger._fh = logger._fh, _FullDisk()
+    record = dict(
+        question="q",
+        user_context={},
+        evidence_summary="",
+        plan_initial=None,
+        plan_final=None,
+        validation_errors=[],
+        sql=None,
+        elapsed_ms=0,
+        error=None,
+    )
+    with caplog.at_level(logging.ERROR, logger="app.core.audit.audit_log"):
+        logger.write(audit_id="lost", **record)
+        logger.flush()
+    assert logger.dropped_records == 1
+    assert "Dropped 1 audit record(s)" in caplog.text
+
+    logger._fh = real_fh
+    logger.write(audit_id="kept", **record)
+    logger.close()
+    assert [json.loads(line)["audit_log_id"] for line in path.read_text(encoding="utf-8").splitlines()] == ["kept"]
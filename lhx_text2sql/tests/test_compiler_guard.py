@@ -1,7 +1,8 @@
 import pytest
+from sqlglot import exp
 
-from app.core.compile.compiler import SqlCompiler
-from app.core.models import EvidenceBundle, MetricDef, PlanDSL, SchemaEntity, TemplateRule, Dimension, OutputSpec, TimeRange
+from app.core.compile.compiler import SqlCompiler, _render_literal
+from app.core.models import EvidenceBundle, MetricDef, PlanDSL, SchemaEntity, TemplateRule, Dimension, Filter, OutputSpec, TimeRange
 
 
 def test_compiler_guard_rejects_unauthorized_field():
@@ -59,4 +60,79 @@ def test_compiler_guard_rejects_unauthorized_field():
 
     compiler = SqlCompiler()
     with pytest.raises(ValueError):
-        compiler.compile(plan, evidence)
+        compiler.compile(plan, evidence)
+
+
+def test_compiler_reuses_template_for_new_literals():
+    evidence = EvidenceBundle(
+        metric_candidates=[
+            MetricDef(
+                metric_id="loss_kwh",
+                name="Loss",
+                definition="",
+                formula="",
+                required_fields=["feeder.loss_kwh"],
+                default_time_grain="day",
+                unit="kWh",
+            )
+        ],
+        schema_candidates=[
+            SchemaEntity(
+                table="feeder",
+                field="ts",
+                field_desc="",
+                aliases=[],
+                unit="",
+                data_type="datetime",
+                quality_tags=[],
+            ),
+            SchemaEntity(
+                table="feeder",
+                field="feeder_name",
+                field_desc="",
+                aliases=[],
+                unit="",
+                data_type="string",
+                quality_tags=[],
+            ),
+        ],
+        join_paths=[],
+        template_rules=[],
+    )
+
+    def make_plan(start, names):
+        return PlanDSL(
+            version="1.0",
+            intent="aggregate",
+            metric_id="loss_kwh",
+            metric_params={},
+            dimensions=[],
+            time_range=TimeRange(start=start, end="2024-01-31"),
+            time_grain="day",
+            filters=[Filter(table="feeder", field="feeder_name", op="in", value=names)],
+            join_path_id="NONE",
+            sort=None,
+            limit=10,
+            output=OutputSpec(format="table", chart_suggest="none"),
+            confidence=0.5,
+            clarifications=[],
+        )
+
+    compiler = SqlCompiler()
+    first = compiler.compile(make_plan("2024-01-01", ["a", "b"]), evidence)
+    second = compiler.compile(make_plan("2024-01-15", ["o'brien", "c"]), evidence)
+
+    assert "BETWEEN '2024-01-01' AND '2024-01-31'" in first
+    assert "IN ('a', 'b')" in first
+    assert "BETWEEN '2024-01-15' AND '2024-01-31'" in second
+    assert "IN ('o''brien', 'c')" in second
+    assert len(compiler._template_cache) == 1
+
+
+@pytest.mark.parametrize("value", [0, -3, 1.5, 1e20, "plain", "o'neil", "back\\slash", "line\nbreak", "tab\t", "", True])
+def test_render_literal_matches_sqlglot(value):
+    if isinstance(value, (int, float)):
+        expected = exp.Literal.number(value)
+    else:
+        expected = exp.Literal.string(str(value))
+    assert _render_literal(value) == expected.sql(dialect="mysql")
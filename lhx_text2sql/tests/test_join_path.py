@@ -1,11 +1,9 @@
 from app.core.models import EvidenceBundle, MetricDef, SchemaEntity, TemplateRule, JoinPath, JoinEdge
 from app.core.planning.validator import PlanValidator
-from app.core.schema import load_schema
 
 
-def test_join_path_not_found():
-    schema = load_schema("schemas/plan_dsl.schema.json")
-    validator = PlanValidator(schema)
+def test_join_path_not_found(plan_schema):
+    validator = PlanValidator(plan_schema)
     evidence = EvidenceBundle(
         metric_candidates=[
             MetricDef(
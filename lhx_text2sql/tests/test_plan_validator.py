@@ -0,0 +1,107 @@
+from app.core.models import EvidenceBundle, MetricDef, SchemaEntity, TemplateRule
+from app.core.planning.validator import PlanValidator
+
+
+def _metric(metric_id: str) -> MetricDef:
+    return MetricDef(
+        metric_id=metric_id,
+        name=metric_id,
+        definition="",
+        formula="",
+        required_fields=["feeder.load_kw"],
+        default_time_grain="day",
+        unit="kw",
+    )
+
+
+def _evidence(metric_ids) -> EvidenceBundle:
+    return EvidenceBundle(
+        metric_candidates=[_metric(metric_id) for metric_id in metric_ids],
+        schema_candidates=[
+            SchemaEntity(
+                table="feeder",
+                field="ts",
+                field_desc="",
+                aliases=[],
+                unit="",
+                data_type="datetime",
+                quality_tags=[],
+            )
+        ],
+        join_paths=[],
+        template_rules=[
+            TemplateRule(
+                template_id="trend_template",
+                intent="trend",
+                allowed_aggs=["sum"],
+                allowed_funcs=["date_format"],
+                required_clauses=["time_range"],
+            )
+        ],
+    )
+
+
+def _plan(metric_id: str) -> dict:
+    return {
+        "version": "1.0",
+        "intent": "trend",
+        "metric_id": metric_id,
+        "metric_params": {},
+        "dimensions": [{"table": "feeder", "field": "feeder_name"}],
+        "time_range": {"start": "2024-02-01", "end": "2024-01-31"},
+        "time_grain": "day",
+        "filters": [],
+        "join_path_id": "NONE",
+        "output": {"format": "table", "chart_suggest": "line"},
+        "confidence": 0.5,
+        "clarifications": [],
+    }
+
+
+def test_incremental_validation_matches_full_validation(plan_schema):
+    validator = PlanValidator(plan_schema)
+    plan = _plan("missing")
+    evidence = _evidence(["load"])
+    previous = validator.validate(plan, evidence)
+    assert {e.code for e in previous} == {"metric_not_found", "dimension_field_invalid", "time_range_invalid"}
+
+    plan["metric_id"] = "load"
+    evidence = _evidence(["load", "other"])
+    changed = {"metric_id", "evidence.metric_candidates"}
+    assert validator.validate_incremental(plan, evidence, previous, changed) == validator.validate(plan, evidence)
+    assert "metric_not_found" not in {e.code for e in validator.validate_incremental(plan, evidence, previous, changed)}
+
+
+def test_incremental_validation_rechecks_changed_keys_against_schema(plan_schema):
+    validator = PlanValidator(plan_schema)
+    plan = _plan("load")
+    evidence = _evidence(["load"])
+    previous = validator.validate(plan, evidence)
+
+    plan["metric_id"] = 42
+    errors = validator.validate_incremental(plan, evidence, previous, {"metric_id"})
+    assert [(e.code, e.field_path) for e in errors] == [("schema", "metric_id")]
+
+
+def test_evidence_replace_resets_lookup_caches():
+    evidence = _evidence(["load"])
+    assert evidence.get_metric("load") is not None
+    evidence.as_dict()
+
+    replaced = evidence.replace(metric_candidates=_evidence(["other"]).metric_candidates)
+    assert replaced.get_metric("load") is None
+    assert replaced.get_metric("other") is not None
+    assert [m["metric_id"] for m in replaced.as_dict()["metric_candidates"]] == ["other"]
+    assert evidence.get_metric("load") is not None
+
+
+def test_time_table_prefers_metric_tables_in_candidate_order(plan_schema):
+    validator = PlanValidator(plan_schema)
+    evidence = _evidence(["load"])
+    evidence = evidence.replace(
+        schema_candidates=evidence.schema_candidates
+        + [evidence.schema_candidates[0].copy(update={"table": "station"})]
+    )
+    assert validator._pick_time_table(evidence, {"station"}) == "station"
+    assert validator._pick_time_table(evidence, {"other"}) == "feeder"
+    assert validator._pick_time_table(evidence.replace(schema_candidates=[]), set()) == ""
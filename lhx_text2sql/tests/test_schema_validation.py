@@ -1,8 +1,63 @@
-from app.core.schema import load_schema, validate_plan
+import copy
 
+import pytest
 
-def test_schema_validation_missing_fields():
-    schema = load_schema("schemas/plan_dsl.schema.json")
+from app.core.models import PlanDSL
+from app.core.schema import compile_validator, validate_plan
+
+
+def _plan() -> dict:
+    return {
+        "version": "1.0",
+        "intent": "rank",
+        "metric_id": "load_rate",
+        "dimensions": [{"table": "feeder", "field": "feeder_name"}],
+        "time_range": {"start": "2024-01-01", "end": "2024-01-31"},
+        "time_grain": "day",
+        "filters": [{"table": "feeder", "field": "region", "op": "in", "value": ["a", "b"]}],
+        "join_path_id": "NONE",
+        "sort": {"by": "metric", "order": "desc"},
+        "limit": 10,
+        "output": {"format": "table", "chart_suggest": "bar"},
+        "confidence": 1,
+        "clarifications": [],
+    }
+
+
+def test_schema_validation_missing_fields(plan_schema):
     invalid_plan = {"version": "1.0"}
-    errors = validate_plan(invalid_plan, schema)
-    assert errors
+    errors = validate_plan(invalid_plan, plan_schema)
+    assert errors
+
+
+def test_schema_rejects_extra_nested_keys(plan_schema):
+    plan = _plan()
+    assert validate_plan(plan, plan_schema) == []
+    plan["dimensions"][0]["alias"] = "x"
+    assert [e.field_path for e in validate_plan(plan, plan_schema)] == ["dimensions.0"]
+
+
+def test_plan_from_validated_matches_parse_obj():
+    plan = _plan()
+    assert PlanDSL.from_validated(plan) == PlanDSL.parse_obj(plan)
+
+
+def test_fast_check_agrees_with_draft7_errors(plan_schema):
+    plan = _plan()
+    plan["limit"] = True
+    plan["confidence"] = 2
+    assert sorted(e.field_path for e in validate_plan(plan, plan_schema)) == ["confidence", "limit"]
+
+
+def test_loaded_schema_is_read_only_and_validators_are_keyed_by_path(plan_schema):
+    with pytest.raises(TypeError):
+        plan_schema["properties"]["limit"] = {}
+    with pytest.raises(TypeError):
+        plan_schema["required"].append("extra")
+
+    edited = copy.deepcopy(plan_schema)
+    edited["properties"]["limit"] = {"type": "integer", "maximum": 5}
+    assert compile_validator(plan_schema) is compile_validator(plan_schema)
+    assert compile_validator(edited) is not compile_validator(plan_schema)
+    assert [e.field_path for e in validate_plan(_plan(), edited)] == ["limit"]
+    assert validate_plan(_plan(), plan_schema) == []
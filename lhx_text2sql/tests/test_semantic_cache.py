@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from app.core.llm.client import LLMClient
+from app.core.llm.semantic_cache import SemanticCacheLLMClient
+
+
+class _CountingClient(LLMClient):
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def generate_json(self, prompt: str, schema: dict):
+        self.calls += 1
+        return {"call": self.calls}
+
+
+def _prompt(question: str, time_range: dict) -> str:
+    payload = {"question": question, "user_context": {}, "time_range": time_range, "evidence": {}}
+    return f"template\n\n<INPUTS>\n{json.dumps(payload, ensure_ascii=False)}"
+
+
+def test_semantic_cache_replays_paraphrase_with_same_context():
+    inner = _CountingClient()
+    client = SemanticCacheLLMClient(inner)
+    january = {"start": "2024-01-01", "end": "2024-01-31"}
+
+    first = client.generate_json(_prompt("线损排名 TOP", january), {})
+    first["call"] = "mutated"
+    assert client.generate_json(_prompt("线损排名top？", january), {}) == {"call": 1}
+    assert client.generate_json(_prompt("停电次数", january), {}) == {"call": 2}
+    assert client.generate_json(_prompt("线损排名 TOP", {"start": "2024-02-01", "end": "2024-02-29"}), {}) == {
+        "call": 3
+    }
+    assert client.generate_json("no inputs marker", {}) == {"call": 4}
+    assert inner.calls == 4
+
+
+def test_semantic_cache_keeps_top_n_and_bottom_n_apart():
+    inner = _CountingClient()
+    client = SemanticCacheLLMClient(inner)
+    january = {"start": "2024-01-01", "end": "2024-01-31"}
+
+    question = "各县公司下属供电所的综合线损率排名前10的供电所"
+
+    assert client.generate_json(_prompt(question, january), {}) == {"call": 1}
+    assert client.generate_json(_prompt(question.replace("前10", "前20"), january), {}) == {"call": 2}
+    assert client.generate_json(_prompt(question.replace("前10", "后10"), january), {}) == {"call": 3}
+    assert client.generate_json(_prompt(question + "？", january), {}) == {"call": 1}
+    assert inner.calls == 3
+
+
+@pytest.mark.parametrize(
+    "cached, asked",
+    [
+        ("统计各个供电所上月的线损率并按从高到低排序", "统计各个供电所本月的线损率并按从高到低排序"),
+        ("统计各个供电所本月线损率的环比变化情况", "统计各个供电所本月线损率的同比变化情况"),
+    ],
+)
+def test_semantic_cache_keeps_time_and_comparison_words_apart(cached, asked):
+    inner = _CountingClient()
+    client = SemanticCacheLLMClient(inner)
+    january = {"start": "2024-01-01", "end": "2024-01-31"}
+
+    assert client.generate_json(_prompt(cached, january), {}) == {"call": 1}
+    assert client.generate_json(_prompt(asked, january), {}) == {"call": 2}
@@ -0,0 +1,39 @@
+import pytest
+
+from app.core.rag.faiss_store import SimpleInMemoryVectorStore
+
+
+def test_vector_store_ranks_overlapping_docs_only():
+    store = SimpleInMemoryVectorStore()
+    store.upsert("a", "feeder load", {"id": "a"})
+    store.upsert("b", "transformer load", {"id": "b"})
+    store.upsert("c", "outage count", {"id": "c"})
+    store.upsert("d", "feeder load kw", {"id": "d"})
+
+    docs = store.query("feeder load", top_k=5)
+    assert [d.doc_id for d in docs] == ["a", "d", "b"]
+    assert docs[0].score == pytest.approx(1.0)
+    assert [d.doc_id for d in store.query("load", top_k=5)] == ["a", "b", "d"]
+    assert store.query("unknown words", top_k=5) == []
+
+
+def test_vector_store_upsert_replaces_tokens():
+    store = SimpleInMemoryVectorStore()
+    store.upsert("a", "feeder load", {"v": 1})
+    store.upsert("a", "outage count", {"v": 2})
+
+    assert store.query("feeder", top_k=5) == []
+    docs = store.query("outage", top_k=5)
+    assert [(d.doc_id, d.metadata) for d in docs] == [("a", {"v": 2})]
+    assert [d.doc_id for d in store.query("load", top_k=5, filter={"v": 1})] == []
+
+
+def test_vector_store_upsert_fields_matches_joined_text():
+    store = SimpleInMemoryVectorStore()
+    store.upsert_fields("a", ["feeder_load", "馈线负荷", "KW"], {"id": "a"})
+    store.upsert("b", "feeder_load 馈线负荷 KW", {"id": "b"})
+
+    docs = store.query("馈线 kw", top_k=5)
+    assert [d.doc_id for d in docs] == ["a", "b"]
+    assert docs[0].score == pytest.approx(docs[1].score)
+    assert docs[0].text == "feeder_load 馈线负荷 KW"
@@ -1,4 +1,6 @@
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 # ================= 配置区域 =================
 
@@ -30,28 +32,30 @@ IGNORE_FILES = {
 
 # ===========================================
 
+# endswith 接受元组，一次 C 层后缀匹配即可
+_ALLOWED_SUFFIXES = tuple(ext.lower() for ext in ALLOWED_EXTENSIONS)
+
 def is_allowed_file(filename):
     """检查文件后缀是否在白名单中，且不在忽略列表中"""
     if filename in IGNORE_FILES:
         return False
-    _, ext = os.path.splitext(filename)
-    return ext.lower() in ALLOWED_EXTENSIONS
+    name = filename.lower()
+    # 与 os.path.splitext 保持一致：'.env' 这类点开头的文件名没有后缀，不读取
+    return name.endswith(_ALLOWED_SUFFIXES) and name not in ALLOWED_EXTENSIONS
 
-def generate_tree(start_path):
-    """生成目录树字符串"""
-    tree_str = []
-    for root, dirs, files in os.walk(start_path):
-        # 过滤忽略的目录
-        dirs[:] = [d for d in dirs if d not in IGNORE_DIRS]
-        
-        level = root.replace(start_path, '').count(os.sep)
-        indent = ' ' * 4 * (level)
-        tree_str.append(f"{indent}{os.path.basename(root)}/")
-        subindent = ' ' * 4 * (level + 1)
-        for f in files:
-            if is_allowed_file(f):
-                tree_str.append(f"{subindent}{f}")
-    return "\n".join(tree_str)
+def read_utf8(file_path):
+    """以 UTF-8 读取文件内容；失败时返回异常对象，由调用方输出提示"""
+    try:
+        # 二进制整体读取后一次性解码，省去文本模式的逐块解码
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        content = data.decode('utf-8')
+    except Exception as e:
+        return e
+    if '\r' in content:
+        # 与文本模式的通用换行一致
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
 
 def merge_files():
     root_dir = os.getcwd()
@@ -60,48 +64,66 @@ def merge_files():
     print(f"🚀 开始合并代码...")
     print(f"📂 扫描目录: {root_dir}")
     
-    merged_content = []
+    tree_lines = []
+    file_content = []
     
-    # 1. 写入项目结构树
+    # 1. 单次遍历：生成项目结构树，并收集待读取的文件
     print("🌳 生成项目结构...")
-    tree = generate_tree(root_dir)
-    merged_content.append("=" * 50)
-    merged_content.append("PROJECT STRUCTURE (项目结构)")
-    merged_content.append("=" * 50)
-    merged_content.append(tree)
-    merged_content.append("\n\n")
-
-    # 2. 遍历并读取文件内容
+    to_read = []
+    root_depth = root_dir.count(os.sep)
     file_count = 0
+    # 逐文件的读取记录先缓存，最后一次性输出，避免每个文件一次终端写入
+    progress = []
     
     for root, dirs, files in os.walk(root_dir):
         # 修改 dirs 列表以跳过忽略的目录
         dirs[:] = [d for d in dirs if d not in IGNORE_DIRS]
         
+        # 深度只需与根目录比较分隔符数量，无需先替换出相对路径
+        level = root.count(os.sep) - root_depth
+        tree_lines.append(f"{' ' * 4 * level}{os.path.basename(root)}/")
+        subindent = ' ' * 4 * (level + 1)
+        
         for file in files:
             if not is_allowed_file(file):
                 continue
+            tree_lines.append(f"{subindent}{file}")
                 
             file_path = os.path.join(root, file)
-            rel_path = os.path.relpath(file_path, root_dir)
-            
-            try:
-                # 尝试以 UTF-8 读取
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    
-                # 格式化写入：添加清晰的文件头
-                header = f"\n\n{'='*50}\nFILE PATH: {rel_path}\n{'='*50}\n"
-                merged_content.append(header)
-                merged_content.append(content)
-                
-                print(f"   + 读取: {rel_path}")
-                file_count += 1
-                
-            except UnicodeDecodeError:
+            to_read.append((os.path.relpath(file_path, root_dir), file_path))
+
+    # 读文件以 I/O 等待为主，多线程并发读取；map 按提交顺序返回，输出顺序不变
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = executor.map(read_utf8, [file_path for _, file_path in to_read])
+        for (rel_path, _), content in zip(to_read, results):
+            if isinstance(content, UnicodeDecodeError):
                 print(f"⚠️  跳过 (编码非UTF-8): {rel_path}")
-            except Exception as e:
-                print(f"❌ 读取错误 {rel_path}: {e}")
+                continue
+            if isinstance(content, Exception):
+                print(f"❌ 读取错误 {rel_path}: {content}")
+                continue
+                
+            # 格式化写入：添加清晰的文件头
+            header = f"\n\n{'='*50}\nFILE PATH: {rel_path}\n{'='*50}\n"
+            file_content.append(header)
+            file_content.append(content)
+            
+            progress.append(f"   + 读取: {rel_path}")
+            file_count += 1
+
+    if progress:
+        sys.stdout.write("\n".join(progress) + "\n")
+        sys.stdout.flush()
+
+    # 2. 项目结构树在前，文件内容在后
+    merged_content = [
+        "=" * 50,
+        "PROJECT STRUCTURE (项目结构)",
+        "=" * 50,
+        "\n".join(tree_lines),
+        "\n\n",
+    ]
+    merged_content.extend(file_content)
 
     # 3. 写入最终文件
     try: